@@ -0,0 +1,64 @@
+"""
+Compare lxml's autolinker with ``autolink_tree`` on link-free and
+link-heavy documents
+
+    python benchmarks/autolink.py [blocks] [repeat]
+"""
+
+import copy
+import sys
+import timeit
+
+import lxml.html
+import lxml.html.clean
+
+from html_sanitizer.sanitizer import autolink_tree
+
+
+def documents(blocks):
+    return {
+        "link-free": "".join(
+            f"<p>Paragraph {i} with <strong>some</strong> text and"
+            f" <em>emphasis</em>, but without any links.</p>"
+            for i in range(blocks)
+        ),
+        "link-heavy": "".join(
+            f"<p>See https://www.python.org/{i}/ and http://lxml.de/?q={i},"
+            f" or <em>mailto:info{i}@python.org</em>.</p>"
+            for i in range(blocks)
+        ),
+    }
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    for label, html in documents(blocks).items():
+        doc = lxml.html.fromstring(f"<div>{html}</div>")
+        print(f"{label}: {len(html) / 1e3:.0f} kB")
+
+        results = []
+        for name, function in (
+            ("lxml", lxml.html.clean.autolink),
+            ("autolink_tree", autolink_tree),
+        ):
+            copies = [copy.deepcopy(doc) for _ in range(repeat)]
+            best = min(
+                timeit.repeat(
+                    lambda: function(copies.pop()),  # noqa: B023
+                    number=1,
+                    repeat=repeat,
+                )
+            )
+            print(f"{name:>14}: {best * 1e3:.1f} ms")
+
+            linked = copy.deepcopy(doc)
+            function(linked)
+            results.append(lxml.html.tostring(linked))
+        assert results[0] == results[1], "Outputs differ"
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare normalizing and sanitizing many small fragments one by one and in
+batches using ``Sanitizer.sanitize_many()``
+
+    python benchmarks/batch.py [fragments] [repeat]
+"""
+
+import random
+import sys
+import timeit
+
+from html_sanitizer.sanitizer import Sanitizer
+
+
+def fragments(count, seed=0):
+    """
+    Short comments and chat messages with some typographic whitespace
+    """
+    rng = random.Random(seed)
+    words = ["Hello", "world", "café", "näive", "ﬁne", "&nbsp;", "ok"]
+    for _ in range(count):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 15)))
+        yield rng.choice(["{}", "<p>{}</p>", "<b>{}</b>\n", "{}\xa0<br>"]).format(text)
+
+
+def best(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    htmls = list(fragments(count))
+    sanitizer = Sanitizer()
+    expected = [sanitizer.sanitize(html) for html in htmls]
+    assert sanitizer.sanitize_many(htmls) == expected
+    print(f"{count} fragments, {sum(map(len, htmls)) / 1e3:.0f} kB")
+
+    for label, one_by_one, batched in (
+        (
+            "normalize",
+            lambda: [sanitizer._normalize(html) for html in htmls],
+            lambda: list(sanitizer._normalize_many(htmls)),
+        ),
+        (
+            "sanitize",
+            lambda: [sanitizer.sanitize(html) for html in htmls],
+            lambda: sanitizer.sanitize_many(htmls),
+        ),
+    ):
+        print(
+            f"{label:>10}: {best(one_by_one, repeat) * 1e3:8.1f} ms one by one,"
+            f" {best(batched, repeat) * 1e3:8.1f} ms batched"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Fit the coefficients of ``html_sanitizer.cost.estimate_cost()`` against the
+benchmark corpus (and optionally against your own documents)
+
+    python benchmarks/calibrate_cost.py [file.html ...]
+
+Prints the coefficients and the accuracy of the estimate. Paste the
+coefficients into ``COEFFICIENTS`` or pass them to ``estimate_cost()``.
+"""
+
+import statistics
+import sys
+import timeit
+
+from corpus import decorated_paste, document
+
+from html_sanitizer.cost import COEFFICIENTS, estimate_cost, scan
+from html_sanitizer.sanitizer import Sanitizer
+
+
+def corpus():
+    for blocks in (1, 3, 10, 30, 100, 300, 1000):
+        yield f"document({blocks})", document(blocks, seed=blocks)
+        yield f"decorated_paste({blocks})", decorated_paste(blocks, seed=blocks)
+        yield (
+            f"text({blocks})",
+            "<p>" + "Lorem ipsum dolor sit amet. " * 10 * blocks + "</p>",
+        )
+    for blocks in (10, 100, 300):
+        yield f"deeply nested({blocks})", document(blocks) + "<span>" * 300 + "x"
+        yield f"lone surrogate({blocks})", document(blocks) + "\ud800"
+
+
+def features(result):
+    return [
+        1.0,
+        result.size,
+        result.tags,
+        result.depth,
+        result.size * result.fallback,
+    ]
+
+
+def least_squares(rows, targets):
+    """
+    Solve the normal equations using Gaussian elimination with partial
+    pivoting. Features are scaled to avoid precision problems.
+    """
+    count = len(rows[0])
+    scale = [max(abs(row[i]) for row in rows) or 1.0 for i in range(count)]
+    rows = [[value / scale[i] for i, value in enumerate(row)] for row in rows]
+    matrix = [
+        [sum(row[i] * row[j] for row in rows) for j in range(count)]
+        + [sum(row[i] * target for row, target in zip(rows, targets))]
+        for i in range(count)
+    ]
+    for column in range(count):
+        pivot = max(range(column, count), key=lambda r: abs(matrix[r][column]))
+        matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+        if abs(matrix[column][column]) < 1e-12:
+            continue
+        for row in range(count):
+            if row != column:
+                factor = matrix[row][column] / matrix[column][column]
+                matrix[row] = [
+                    a - factor * b for a, b in zip(matrix[row], matrix[column])
+                ]
+    return [
+        matrix[i][count] / matrix[i][i] / scale[i] if matrix[i][i] else 0.0
+        for i in range(count)
+    ]
+
+
+def main():
+    documents = list(corpus())
+    for path in sys.argv[1:]:
+        with open(path, encoding="utf-8") as f:
+            documents.append((path, f.read()))
+
+    sanitizer = Sanitizer()
+    sanitizer.sanitize("<p>warm-up</p>")
+    rows, targets = [], []
+    for _name, html in documents:
+        rows.append(features(scan(html)))
+        timings = timeit.repeat(
+            lambda: sanitizer.sanitize(html),  # noqa: B023
+            number=1,
+            repeat=3,
+        )
+        targets.append(min(timings))
+
+    scan_time = sum(
+        min(timeit.repeat(lambda: scan(html), number=1, repeat=3))  # noqa: B023
+        for _name, html in documents
+    )
+    print(f"Scanning took {scan_time / sum(targets):.1%} of the sanitization time")
+
+    # Weight documents by the inverse of their cost so that the relative
+    # error of small documents matters as much as that of large ones
+    weights = [1 / target for target in targets]
+    rows = [[value * weight for value in row] for row, weight in zip(rows, weights)]
+    weighted = [target * weight for target, weight in zip(targets, weights)]
+
+    # Costs never decrease, fit again without features with negative
+    # coefficients until all are non-negative
+    active = list(range(len(COEFFICIENTS)))
+    while True:
+        fitted = least_squares([[row[i] for i in active] for row in rows], weighted)
+        if min(fitted) >= 0:
+            break
+        del active[fitted.index(min(fitted))]
+    coefficients = dict.fromkeys(COEFFICIENTS, 0.0)
+    for index, value in zip(active, fitted):
+        coefficients[list(COEFFICIENTS)[index]] = value
+
+    print("\nCOEFFICIENTS = {")
+    for key, value in coefficients.items():
+        print(f'    "{key}": {value:.3g},')
+    print("}\n")
+
+    errors = []
+    for (name, html), target in zip(documents, targets):
+        estimate = estimate_cost(html, coefficients=coefficients)
+        errors.append(abs(estimate - target) / target)
+        print(
+            f"{name:>24}: {target * 1e3:9.2f} ms measured,"
+            f" {estimate * 1e3:9.2f} ms estimated"
+        )
+    print(
+        f"\nRelative error: {statistics.median(errors):.0%} median,"
+        f" {max(errors):.0%} max"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Synthetic documents for the benchmarks in this directory
+"""
+
+import random
+
+
+PARAGRAPHS = [
+    "<p>Lorem <strong>ipsum</strong> dolor sit amet, <em>consectetur</em>"
+    " adipiscing elit. <a href='https://example.com/{i}'>Link {i}</a></p>",
+    "<h2 id='section-{i}'>Section {i}</h2>",
+    "<ul><li>First item</li><li><p>Second <b>item</b></p></li>"
+    "<li>- Third item</li></ul>",
+    "<p><span style='font-weight:bold'>Bold</span> and"
+    " <span style='font-style:italic'>italic</span><br><br> text</p>",
+    "<div class='wrapper'><div><span><span>Nested {i}</span></span></div></div>",
+    "<p>Visit www.example.com or write to info@example.com</p>",
+    "<table><tr><td>Cell {i}</td><td><font color=red>old</font></td></tr></table>",
+    "<p> </p><p><br></p><blockquote>Quote {i}</blockquote>",
+]
+
+
+def document(blocks, *, seed=0):
+    """
+    Return a document consisting of ``blocks`` pseudo-random blocks
+    """
+    rng = random.Random(seed)
+    return "".join(rng.choice(PARAGRAPHS).format(i=i) for i in range(blocks))
+
+
+DECORATED = [
+    "<p class=MsoNormal style='margin:0cm;line-height:115%'><span lang=DE"
+    " style='font-size:11.0pt;font-family:\"Calibri\",sans-serif'>Paragraph {i}"
+    " with <b><span style='mso-bidi-font-weight:normal'>bold</span></b>"
+    " text<o:p></o:p></span></p>",
+    "<p class=MsoNormal><span style='font-size:11.0pt'><o:p>&nbsp;</o:p></span></p>",
+    "<div style='border:none'><div><span style='color:#333'> <font face=Arial>"
+    " <span> </span> </font> </span></div></div>",
+    "<table class=MsoTableGrid><tr><td width=302 valign=top style='width:8cm'>"
+    "<p class=MsoNormal><span style='font-size:10pt'>Cell {i}</span></p></td>"
+    "<td><p class=MsoNormal><span> </span></p></td></tr></table>",
+    "<p class=MsoListParagraph style='text-indent:-18.0pt'><span"
+    " style='font-family:Symbol'>·<span style='font:7.0pt \"Times New Roman\"'>"
+    "&nbsp;&nbsp;&nbsp; </span></span><span>Item {i}</span></p>",
+]
+
+
+def decorated_paste(blocks, *, seed=0):
+    """
+    Return a document resembling content pasted from a word processor
+    """
+    rng = random.Random(seed)
+    return "".join(rng.choice(DECORATED).format(i=i) for i in range(blocks))
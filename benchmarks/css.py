@@ -0,0 +1,66 @@
+"""
+Compare cleaning style attributes using ``css_properties`` (parsed once per
+distinct style string) with a postprocessor parsing every attribute
+
+    python benchmarks/css.py [blocks] [repeat]
+"""
+
+import sys
+import timeit
+
+from corpus import decorated_paste
+
+from html_sanitizer.css import parse_style
+from html_sanitizer.sanitizer import Sanitizer
+
+
+PROPERTIES = {"text-align": {"left", "center", "right"}, "color": None}
+
+
+def clean_style_postprocessor(element):
+    style = element.get("style")
+    if style is not None:
+        declarations = [
+            f"{name}: {value}"
+            for name, value in parse_style.__wrapped__(style)
+            if name in PROPERTIES
+        ]
+        if declarations:
+            element.set("style", "; ".join(declarations))
+        else:
+            del element.attrib["style"]
+    return element
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    html = decorated_paste(blocks)
+    print(f"Document: {len(html) / 1e3:.0f} kB, {blocks} blocks")
+
+    settings = {
+        "tags": {"p", "span", "strong", "em", "br"},
+        "attributes": {"p": ("style",), "span": ("style",)},
+        "empty": {"br"},
+        "separate": {"p"},
+    }
+    sanitizers = {
+        "postprocessor": Sanitizer(
+            {**settings, "element_postprocessors": [clean_style_postprocessor]}
+        ),
+        "css_properties": Sanitizer({**settings, "css_properties": PROPERTIES}),
+    }
+    for name, sanitizer in sanitizers.items():
+        best = min(
+            timeit.repeat(
+                lambda: sanitizer.sanitize(html),  # noqa: B023
+                number=1,
+                repeat=repeat,
+            )
+        )
+        print(f"{name:>16}: {best * 1e3:.1f} ms")
+    print(f"Distinct style strings parsed: {parse_style.cache_info().currsize}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare the recovering lxml parser with the BeautifulSoup fallback on
+documents which lxml's default parser rejects
+
+    python benchmarks/parsers.py [blocks] [repeat]
+"""
+
+import sys
+import timeit
+
+from corpus import document
+
+from html_sanitizer.sanitizer import Sanitizer
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    broken = {
+        "deeply nested": document(blocks) + "<span>" * 300 + "x",
+        "lone surrogate": document(blocks) + "\ud800",
+    }
+    sanitizers = {
+        "recover": Sanitizer({"parsers": ["lxml", "recover"]}),
+        "soup": Sanitizer({"parsers": ["lxml", "soup"]}),
+    }
+
+    for label, html in broken.items():
+        print(f"{label}: {len(html) / 1e3:.0f} kB")
+        for name, sanitizer in sanitizers.items():
+            try:
+                sanitizer.sanitize(html)
+            except Exception as exc:
+                print(f"{name:>12}: fails ({exc.__class__.__name__})")
+                continue
+            best = min(
+                timeit.repeat(
+                    lambda: sanitizer.sanitize(html),  # noqa: B023
+                    number=1,
+                    repeat=repeat,
+                )
+            )
+            print(f"{name:>12}: {best * 1e3:.1f} ms")
+        print()
+
+    for name, sanitizer in sanitizers.items():
+        print(f"{name:>12}: {dict(sanitizer.parser_stats)}")
+
+
+if __name__ == "__main__":
+    main()
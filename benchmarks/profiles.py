@@ -0,0 +1,69 @@
+"""
+Compare sanitizing the same content using several profiles with separate
+``sanitize()`` calls and with ``sanitize_profiles()``
+
+    python benchmarks/profiles.py [blocks] [repeat]
+"""
+
+import sys
+import timeit
+
+from corpus import decorated_paste, document
+
+from html_sanitizer.sanitizer import Sanitizer, sanitize_profiles
+
+
+PROFILES = {
+    "email": {
+        "tags": {"p", "br", "strong", "em", "a"},
+        "attributes": {"a": ("href",)},
+        "empty": {"br"},
+        "separate": {"p", "a"},
+    },
+    "web": {
+        "tags": {"p", "br", "strong", "em", "a", "h2", "h3", "ul", "ol", "li"},
+        "attributes": {"a": ("href", "title")},
+        "empty": {"br"},
+        "separate": {"p", "a", "li"},
+        "autolink": True,
+    },
+    "notification": {
+        "tags": {"strong", "em"},
+        "attributes": {},
+        "empty": set(),
+        "separate": set(),
+    },
+}
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    sanitizers = [Sanitizer(settings) for settings in PROFILES.values()]
+
+    for label, html in (
+        ("document", document(blocks)),
+        ("decorated_paste", decorated_paste(blocks)),
+    ):
+        print(f"{label}: {len(html) / 1e3:.0f} kB, {len(sanitizers)} profiles")
+        outputs = [sanitizer.sanitize(html) for sanitizer in sanitizers]
+        assert sanitize_profiles(html, sanitizers) == outputs
+
+        def separate():
+            return [sanitizer.sanitize(html) for sanitizer in sanitizers]  # noqa: B023
+
+        def shared():
+            return sanitize_profiles(html, sanitizers)  # noqa: B023
+
+        approaches = {"separate": separate, "shared": shared}
+        # Alternate between the approaches so that both see the same noise
+        timings = {name: [] for name in approaches}
+        for _ in range(repeat):
+            for name, function in approaches.items():
+                timings[name].append(timeit.timeit(function, number=1))
+        for name, times in timings.items():
+            print(f"{name:>10}: {min(times) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
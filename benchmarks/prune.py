@@ -0,0 +1,39 @@
+"""
+Measure the effect of pruning whitespace-only subtrees before the tree walk
+on heavily decorated content
+
+    python benchmarks/prune.py [blocks] [repeat]
+"""
+
+import sys
+import timeit
+
+from corpus import decorated_paste
+
+from html_sanitizer.sanitizer import Sanitizer
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    html = decorated_paste(blocks)
+    print(f"Document: {len(html) / 1e3:.0f} kB, {blocks} blocks")
+
+    pruning = Sanitizer()
+    walking = Sanitizer()
+    walking._prune_expression = None
+    assert pruning.sanitize(html) == walking.sanitize(html)
+
+    # Alternate between the sanitizers so that both see the same noise
+    timings = {"walk only": [], "prune first": []}
+    for _ in range(repeat):
+        for name, sanitizer in (("walk only", walking), ("prune first", pruning)):
+            timings[name].append(
+                timeit.timeit(lambda: sanitizer.sanitize(html), number=1)  # noqa: B023
+            )
+    for name, times in timings.items():
+        print(f"{name:>12}: {min(times) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Soak test: Run many mixed documents through a single sanitizer and watch
+the memory usage of the process
+
+    python benchmarks/soak.py [--documents N] [--interval N] [--tracemalloc]
+
+The resident set size (and, with ``--tracemalloc``, the memory allocated by
+Python) is sampled every ``--interval`` documents. The exit status is 1 if
+memory grows by more than ``--max-growth`` MB between the first and the
+last third of the samples taken after the warm-up. ``--tracemalloc`` slows
+sanitizing down considerably but reports where the memory is allocated.
+"""
+
+import argparse
+import gc
+import os
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+from corpus import decorated_paste, document
+
+from html_sanitizer.sanitizer import Sanitizer
+from html_sanitizer.urls import URLPolicy
+
+
+SETTINGS = {
+    "autolink": True,
+    "tags": {"a", "img", "p", "strong", "em", "ul", "li", "br", "h2"},
+    "attributes": {"a": ("href",), "img": ("src", "alt"), "p": ("style",)},
+    "empty": {"img", "br"},
+    "separate": {"a", "img", "p", "li"},
+    "css_properties": {"text-align": {"left", "center", "right"}, "color": None},
+    "sanitize_href": URLPolicy(attributes={"src": {"schemes": {"https", "data"}}}),
+}
+
+
+def documents(seed=0):
+    """
+    Yield an endless stream of documents exercising the parsers, the caches
+    and the autolinker, many of them unique
+    """
+    index = seed
+    while True:
+        index += 1
+        kind = index % 8
+        if kind == 0:
+            yield document(1 + index % 20, seed=index)
+        elif kind == 1:
+            yield decorated_paste(1 + index % 20, seed=index)
+        elif kind == 2:
+            # Too deep for lxml's default parser
+            yield "<span>" * 300 + f"deep {index}"
+        elif kind == 3:
+            yield f"<p>lone surrogate \ud800 {index}</p>"
+        elif kind == 4:
+            yield (
+                f"<p style='color: #{index % 0xFFFFFF:06x}; text-align: center'>"
+                f"<a href='https://example{index}.com/'>unique</a></p>"
+            )
+        elif kind == 5:
+            yield f"<p>Visit www.example{index}.com or mail a{index}@example.com</p>"
+        elif kind == 6:
+            # Huge values which must not be kept alive by the caches
+            yield (
+                f"<p style='color: red;{' ' * 5000}{index}'>x</p>"
+                f"<img src='data:image/png;base64,{'A' * 20000}{index}'>"
+            )
+        else:
+            yield f"<ul><li>- item {index}<li><p><b>bold</b> text</p></ul>"
+
+
+def rss():
+    """
+    Return the resident set size in MB (the peak RSS where ``/proc`` isn't
+    available)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+
+
+def growth(samples):
+    """
+    Return the difference between the medians of the last and the first
+    third of ``samples``
+    """
+    third = max(len(samples) // 3, 1)
+    return statistics.median(samples[-third:]) - statistics.median(samples[:third])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--interval", type=int, default=10_000)
+    parser.add_argument(
+        "--warm-up", type=int, default=20_000, help="Documents before sampling"
+    )
+    parser.add_argument("--max-growth", type=float, default=5.0, help="In MB")
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+
+    sanitizer = Sanitizer(SETTINGS)
+    stream = documents()
+    for _ in range(args.warm_up):
+        sanitizer.sanitize(next(stream))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    gc.collect()
+    first_snapshot = tracemalloc.take_snapshot() if args.tracemalloc else None
+
+    rss_samples, traced_samples = [], []
+    start = time.perf_counter()
+    for count in range(1, args.documents + 1):
+        sanitizer.sanitize(next(stream))
+        if count % args.interval == 0:
+            gc.collect()
+            rss_samples.append(rss())
+            line = f"{count:>10} documents {rss_samples[-1]:8.1f} MB RSS"
+            if args.tracemalloc:
+                traced_samples.append(tracemalloc.get_traced_memory()[0] / 1e6)
+                line += f" {traced_samples[-1]:8.2f} MB traced"
+            print(
+                f"{line} {count / (time.perf_counter() - start):8.0f} documents/s",
+                flush=True,
+            )
+
+    if args.tracemalloc:
+        print("\nLargest allocation differences since the warm-up:")
+        snapshot = tracemalloc.take_snapshot()
+        for stat in snapshot.compare_to(first_snapshot, "lineno")[:10]:
+            print(f"  {stat}")
+
+    failed = False
+    for label, samples in (("RSS", rss_samples), ("traced", traced_samples)):
+        if len(samples) >= 3:
+            difference = growth(samples)
+            print(f"\n{label} growth: {difference:.2f} MB")
+            failed = failed or difference > args.max_growth
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Compare the peak memory of materializing all element proxies before the
+tree walk with the lazy traversal used by ``Sanitizer._clean``
+
+    python benchmarks/walk_memory.py [blocks]
+"""
+
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import lxml.html
+from corpus import document
+
+from html_sanitizer.sanitizer import Sanitizer, last_descendant, preceding
+
+
+def materialized(doc):
+    backlog = deque(doc.iterdescendants())
+    count = 0
+    while backlog:
+        backlog.pop()
+        count += 1
+    return count
+
+
+def lazy(doc):
+    count = 0
+    element = last_descendant(doc) if len(doc) else None
+    while element is not None:
+        element = preceding(element, doc)
+        count += 1
+    return count
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    html = document(blocks)
+    print(f"Document: {len(html) / 1e6:.1f} MB, {blocks} blocks")
+
+    for function in (materialized, lazy):
+        doc = lxml.html.fromstring(f"<div>{html}</div>")
+        count, elapsed, peak = measure(function, doc)
+        print(
+            f"{function.__name__:>12}: {count} elements,"
+            f" {elapsed * 1e3:.0f} ms, peak {peak / 1e6:.1f} MB"
+        )
+
+    sanitizer = Sanitizer()
+    _result, elapsed, peak = measure(sanitizer.sanitize, html)
+    print(f"{'sanitize':>12}: {elapsed * 1e3:.0f} ms, peak {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
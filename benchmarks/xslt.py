@@ -0,0 +1,46 @@
+"""
+Compare the ``"python"`` and the ``"xslt"`` engine on typical and on heavily
+decorated content
+
+    python benchmarks/xslt.py [blocks] [repeat]
+"""
+
+import sys
+import timeit
+
+from corpus import decorated_paste, document
+
+from html_sanitizer.sanitizer import Sanitizer
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    engines = {
+        "python": Sanitizer(),
+        "xslt": Sanitizer({"engine": "xslt"}),
+    }
+    for label, html in (
+        ("document", document(blocks)),
+        ("decorated_paste", decorated_paste(blocks)),
+    ):
+        print(f"{label}: {len(html) / 1e3:.0f} kB, {blocks} blocks")
+        assert engines["python"].sanitize(html) == engines["xslt"].sanitize(html)
+
+        # Alternate between the engines so that both see the same noise
+        timings = {name: [] for name in engines}
+        for _ in range(repeat):
+            for name, sanitizer in engines.items():
+                timings[name].append(
+                    timeit.timeit(
+                        lambda: sanitizer.sanitize(html),  # noqa: B023
+                        number=1,
+                    )
+                )
+        for name, times in timings.items():
+            print(f"{name:>8}: {min(times) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class HTMLSanitizerConfig(AppConfig):
+    name = "html_sanitizer"
+    verbose_name = "HTML sanitizer"
+
+    def ready(self):
+        from .django import registry  # noqa: PLC0415
+
+        registry.warm()
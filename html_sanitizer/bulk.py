@@ -0,0 +1,129 @@
+"""
+Resumable bulk sanitization of files
+
+A manifest (a SQLite database) records the input hash, the sanitizer's
+settings fingerprint and the output hash of every processed file. Files
+whose input and settings haven't changed since the last run are skipped.
+The manifest is committed after every batch, so an interrupted run resumes
+where it stopped.
+"""
+
+import hashlib
+import os
+import sqlite3
+
+from .cli import run, worker_sanitizer, write_file
+
+
+class Manifest:
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " key TEXT PRIMARY KEY,"
+            " input_hash TEXT NOT NULL,"
+            " fingerprint TEXT NOT NULL,"
+            " output_hash TEXT NOT NULL"
+            ")"
+        )
+        self.connection.commit()
+
+    def get(self, key):
+        return self.connection.execute(
+            "SELECT input_hash, fingerprint, output_hash FROM items WHERE key=?",
+            (key,),
+        ).fetchone()
+
+    def update(self, rows):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)", rows
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def process_file(task):
+    """
+    Hash a file and sanitize it unless its hash is one of ``skip``
+
+    Returns ``(source, destination, size, input_hash, output, error)``;
+    ``output`` is ``None`` for skipped files.
+    """
+    source, destination, skip = task
+    size = 0
+    try:
+        with open(source, "rb") as f:
+            data = f.read()
+        size = len(data)
+        input_hash = digest(data)
+        if input_hash in skip:
+            return source, destination, size, input_hash, None, None
+        html = data.decode("utf-8")
+        output = worker_sanitizer().sanitize(html)
+        return source, destination, size, input_hash, output, None
+    except Exception as exc:
+        return source, destination, size, None, None, repr(exc)
+
+
+class BulkJob:
+    """
+    Sanitize ``(source, destination)`` file pairs, skipping everything the
+    manifest already knows about
+    """
+
+    def __init__(self, manifest, *, fingerprint, config=None, jobs=1, batch_size=100):
+        self.manifest = manifest
+        self.fingerprint = fingerprint
+        self.config = config
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.skipped = 0
+
+    def tasks(self, files):
+        for source, destination in files:
+            skip = ()
+            row = self.manifest.get(source)
+            if row and row[1] == self.fingerprint:
+                # Sanitizing in place replaces the input with the output
+                skip = (row[0], row[2]) if source == destination else (row[0],)
+                if not os.path.exists(destination):
+                    skip = ()
+            yield source, destination, skip
+
+    def flush(self, batch):
+        rows = []
+        for source, destination, input_hash, output in batch:
+            data = output.encode("utf-8")
+            # Files sanitized in place are only replaced once fully written
+            write_file(destination, data)
+            rows.append((source, input_hash, self.fingerprint, digest(data)))
+        self.manifest.update(rows)
+        batch.clear()
+
+    def run(self, files):
+        """
+        Process all files; yields ``(source, None, length, error)`` tuples
+        like the command line interface's workers
+        """
+        batch = []
+        results = run(
+            process_file, self.tasks(files), jobs=self.jobs, config=self.config
+        )
+        for source, destination, size, input_hash, output, error in results:
+            if error is not None:
+                yield source, None, size, error
+                continue
+            if output is None:
+                self.skipped += 1
+                continue
+            batch.append((source, destination, input_hash, output))
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+            yield source, None, size, None
+        self.flush(batch)
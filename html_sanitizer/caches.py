@@ -0,0 +1,31 @@
+"""
+Caches for functions of strings which are often repeated, such as style
+attributes and URLs
+"""
+
+from functools import lru_cache, update_wrapper
+
+
+def string_cache(maxsize, *, max_length=1024):
+    """
+    Like ``functools.lru_cache`` for functions of a single string argument,
+    but strings longer than ``max_length`` are neither looked up nor stored
+
+    Long-running processes would otherwise keep up to ``maxsize`` huge
+    values (e.g. ``data:`` URLs or pasted style attributes) alive.
+    """
+
+    def decorator(function):
+        cached = lru_cache(maxsize=maxsize)(function)
+
+        def wrapper(value):
+            if len(value) > max_length:
+                return function(value)
+            return cached(value)
+
+        update_wrapper(wrapper, function)
+        wrapper.cache_info = cached.cache_info
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+
+    return decorator
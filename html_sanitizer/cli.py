@@ -0,0 +1,381 @@
+"""
+Command line interface, see ``python -m html_sanitizer --help``
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import functools
+import json
+import os
+import runpy
+import stat
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from .sanitizer import Sanitizer
+
+
+def load_settings(path):
+    """
+    Load sanitizer settings from a JSON file or from the ``SETTINGS``
+    variable of a Python file
+    """
+    if path is None:
+        return None
+    if path.endswith(".py"):
+        return runpy.run_path(path)["SETTINGS"]
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_field(record, path):
+    for key in path:
+        record = record[key]
+    return record
+
+
+def set_field(record, path, value):
+    for key in path[:-1]:
+        record = record[key]
+    record[path[-1]] = value
+
+
+# Per process state, initialized by init_worker()
+_sanitizer = None
+
+
+def init_worker(config):
+    global _sanitizer  # noqa: PLW0603
+    _sanitizer = Sanitizer(load_settings(config))
+
+
+def worker_sanitizer():
+    return _sanitizer
+
+
+@functools.cache
+def default_file_mode():
+    # The umask can only be read by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def write_file(path, data):
+    """
+    Write ``data`` (bytes) to ``path`` atomically
+
+    The data is written to a temporary file in the same directory first
+    which then replaces ``path``, so that sanitizing in place never leaves
+    a truncated file behind and readers never see partially written
+    files. Existing files keep their permissions.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = default_file_mode()
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def sanitize_file(task):
+    """
+    Sanitize a single file; writes the result to ``destination`` if given,
+    returns it otherwise
+    """
+    source, destination = task
+    html = ""
+    try:
+        with open(source, encoding="utf-8") as f:
+            html = f.read()
+        output = _sanitizer.sanitize(html)
+        if destination is not None:
+            write_file(destination, output.encode("utf-8"))
+            output = None
+    except Exception as exc:
+        return source, None, len(html), repr(exc)
+    return source, output, len(html), None
+
+
+def sanitize_record(task):
+    """
+    Sanitize the field at ``path`` of a single NDJSON line
+    """
+    line, path = task
+    try:
+        record = json.loads(line)
+        set_field(record, path, _sanitizer.sanitize(get_field(record, path)))
+    except Exception as exc:
+        return line, None, len(line), repr(exc)
+    return line, json.dumps(record, ensure_ascii=False), len(line), None
+
+
+def sanitize_records(tasks):
+    """
+    Sanitize the fields of several NDJSON lines using ``sanitize_many()``,
+    falling back to ``sanitize_record()`` for each line if anything fails
+    """
+    try:
+        records = [json.loads(line) for line, _path in tasks]
+        values = [
+            get_field(record, path) for record, (_line, path) in zip(records, tasks)
+        ]
+        outputs = _sanitizer.sanitize_many(values)
+    except Exception:
+        return [sanitize_record(task) for task in tasks]
+    results = []
+    for record, (line, path), output in zip(records, tasks, outputs):
+        set_field(record, path, output)
+        serialized = json.dumps(record, ensure_ascii=False)
+        results.append((line, serialized, len(line), None))
+    return results
+
+
+def iter_files(paths, *, pattern, output_dir, in_place):
+    """
+    Yield ``(source, destination)`` tuples for all files, descending into
+    directories
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            destination = None
+            if in_place:
+                destination = path
+            elif output_dir:
+                destination = os.path.join(output_dir, os.path.basename(path))
+            yield path, destination
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(fnmatch.filter(files, pattern)):
+                source = os.path.join(root, name)
+                destination = None
+                if in_place:
+                    destination = source
+                elif output_dir:
+                    destination = os.path.join(
+                        output_dir, os.path.relpath(source, path)
+                    )
+                yield source, destination
+
+
+def iter_lines(paths):
+    if not paths:
+        yield from sys.stdin
+        return
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            yield from f
+
+
+def run_chunk(function, chunk):
+    return [function(task) for task in chunk]
+
+
+def run(function, tasks, *, jobs, config, chunksize=32, batched=False):
+    """
+    Run ``function`` over all tasks, in a pool of ``jobs`` worker processes
+    if ``jobs`` is larger than one. Results are yielded in order.
+
+    Tasks are submitted in chunks and only a few chunks per worker are in
+    flight at any time, so arbitrarily long task iterables can be processed.
+    ``batched`` functions receive a whole chunk and return a list of results.
+    """
+    tasks = iter(tasks)
+    if jobs <= 1:
+        init_worker(config)
+        if not batched:
+            yield from map(function, tasks)
+            return
+        while chunk := list(islice(tasks, chunksize)):
+            yield from function(chunk)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(
+        jobs, initializer=init_worker, initargs=(config,)
+    ) as executor:
+        while chunk := list(islice(tasks, chunksize)):
+            if batched:
+                pending.append(executor.submit(function, chunk))
+            else:
+                pending.append(executor.submit(run_chunk, function, chunk))
+            if len(pending) >= 4 * jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m html_sanitizer",
+        description="Sanitize HTML files, directories or NDJSON records.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Files or directories to sanitize. Reads standard input if empty.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes, 0 uses all CPUs (default: 1)",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="JSON file or Python file defining SETTINGS for the sanitizer",
+    )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="Input and output are newline delimited JSON records",
+    )
+    parser.add_argument(
+        "--field",
+        default="html",
+        help="Dotted path of the HTML field in NDJSON records (default: html)",
+    )
+    parser.add_argument(
+        "--pattern",
+        default="*.html",
+        help="Filename pattern used inside directories (default: *.html)",
+    )
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument(
+        "-i", "--in-place", action="store_true", help="Overwrite input files"
+    )
+    output.add_argument(
+        "-o",
+        "--output-dir",
+        help="Write sanitized files into this directory, mirroring the input",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="Manifest database for resumable bulk jobs: Files whose contents"
+        " and settings haven't changed since the last run are skipped."
+        " Requires --in-place or --output-dir.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of outputs written per manifest commit (default: 100)",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Do not print a summary"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None, *, stdout=None, stderr=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        from .server import main  # noqa: PLC0415
+
+        return main(argv[1:])
+    if argv[:1] == ["replay"]:
+        from .recorder import main  # noqa: PLC0415
+
+        return main(argv[1:], stdout=stdout)
+
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    args = parse_args(argv)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    if not args.paths and not args.ndjson:
+        sanitizer = Sanitizer(load_settings(args.config))
+        stdout.write(sanitizer.sanitize(sys.stdin.read()) + "\n")
+        return 0
+
+    job = None
+    if args.manifest:
+        if args.ndjson or not (args.in_place or args.output_dir):
+            stderr.write("--manifest requires --in-place or --output-dir\n")
+            return 2
+
+        from .bulk import BulkJob, Manifest  # noqa: PLC0415
+
+        job = BulkJob(
+            Manifest(args.manifest),
+            fingerprint=Sanitizer(load_settings(args.config)).fingerprint,
+            config=args.config,
+            jobs=jobs,
+            batch_size=args.batch_size,
+        )
+        results = job.run(
+            iter_files(
+                args.paths,
+                pattern=args.pattern,
+                output_dir=args.output_dir,
+                in_place=args.in_place,
+            )
+        )
+    elif args.ndjson:
+        if args.in_place or args.output_dir:
+            stderr.write("--in-place and --output-dir cannot be used with --ndjson\n")
+            return 2
+        path = args.field.split(".")
+        tasks = ((line, path) for line in iter_lines(args.paths) if line.strip())
+        results = run(
+            sanitize_records,
+            tasks,
+            jobs=jobs,
+            config=args.config,
+            chunksize=256,
+            batched=True,
+        )
+    else:
+        tasks = iter_files(
+            args.paths,
+            pattern=args.pattern,
+            output_dir=args.output_dir,
+            in_place=args.in_place,
+        )
+        results = run(sanitize_file, tasks, jobs=jobs, config=args.config)
+
+    start = time.perf_counter()
+    count = size = 0
+    failures = []
+    for source, output, length, error in results:
+        count += 1
+        size += length
+        if error is not None:
+            failures.append(source)
+            stderr.write(f"Failed to sanitize {source.strip()[:100]}: {error}\n")
+        elif output is not None:
+            stdout.write(output + "\n")
+    elapsed = time.perf_counter() - start
+
+    if job is not None:
+        job.manifest.close()
+
+    if not args.quiet:
+        stderr.write(
+            f"Sanitized {count - len(failures)} of {count} documents"
+            f" ({size / 1e6:.1f} MB) in {elapsed:.2f}s,"
+            f" {count / elapsed if elapsed else 0:.0f} documents/s,"
+            f" {len(failures)} failures"
+            + (f", {job.skipped} unchanged documents skipped" if job else "")
+            + "\n"
+        )
+    return 1 if failures else 0
@@ -0,0 +1,124 @@
+"""
+Cheap estimates of the sanitization cost of inputs, e.g. for deciding
+whether to sanitize a document inline or in a background job
+"""
+
+import re
+from collections import namedtuple
+
+
+__all__ = ("COEFFICIENTS", "Scan", "estimate_cost", "scan")
+
+
+Scan = namedtuple("Scan", "size tags depth fallback")
+Scan.__doc__ = """
+Result of ``scan()``: The length of the input, the approximate number of
+tags and nesting depth and whether the default lxml parser will probably
+reject the input, so that a slower fallback parser has to be used
+"""
+
+# Neither the name nor the attributes can extend past the next "<" and the
+# name can only end where the attributes or the tag end, so unclosed tags
+# aren't rescanned again and again and scanning stays linear
+_tag_re = re.compile(r"<(/?)([a-zA-Z][^\s/<>]*)((?:[\s/][^<>]*)?)>")
+_surrogate_re = re.compile(r"[\ud800-\udfff]")
+
+# Elements without a closing tag
+_void_tags = frozenset(
+    {
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+    }
+)
+# Elements which are closed implicitly by a following sibling of the same type
+_implied_end_tags = frozenset({"dd", "dt", "li", "option", "p", "td", "th", "tr"})
+
+# libxml2 stops parsing deeper documents without ``huge_tree``; the
+# sanitizer wraps the document in a few more elements
+MAX_DEPTH = 250
+# libxml2's limit for a single text node without ``huge_tree``
+MAX_TEXT_LENGTH = 10_000_000
+
+# Seconds per unit, fitted using ``benchmarks/calibrate_cost.py``
+COEFFICIENTS = {
+    "base": 2.03e-4,
+    "size": 1.9e-7,
+    "tags": 2.47e-5,
+    "depth": 1.13e-5,
+    "fallback_size": 2.99e-7,
+}
+
+
+def scan(html):
+    """
+    Scan ``html`` without building a tree and return a ``Scan`` tuple
+
+    Tags are found using a regular expression and the depth is tracked
+    using a stack which knows about void elements and implicitly closed
+    elements such as ``p`` and ``li``, so the numbers are approximations.
+    """
+    tags = depth = text = end = 0
+    stack = []
+    for match in _tag_re.finditer(html):
+        # The longest run of text between two tags
+        text = max(text, match.start() - end)
+        end = match.end()
+        closing, name, attributes = match.groups()
+        name = name.lower()
+        if closing:
+            # Close the element and everything opened after it, but only
+            # look at the innermost few elements
+            for index in range(len(stack) - 1, max(len(stack) - 9, -1), -1):
+                if stack[index] == name:
+                    del stack[index:]
+                    break
+            continue
+        tags += 1
+        if attributes.endswith("/") or name in _void_tags:
+            continue
+        if name in _implied_end_tags and stack and stack[-1] == name:
+            continue
+        stack.append(name)
+        depth = max(depth, len(stack))
+    text = max(text, len(html) - end)
+
+    fallback = (
+        depth >= MAX_DEPTH
+        or text >= MAX_TEXT_LENGTH
+        or _surrogate_re.search(html) is not None
+    )
+    return Scan(size=len(html), tags=tags, depth=depth, fallback=fallback)
+
+
+def estimate_cost(html, *, coefficients=None):
+    """
+    Return the estimated time in seconds ``Sanitizer.sanitize()`` needs for
+    ``html`` (or for a ``Scan`` of it) using the default settings
+
+    The estimate is a linear model of the size, the number of tags, the
+    nesting depth and the size of documents requiring a fallback parser.
+    The default ``COEFFICIENTS`` were measured on a single machine; run
+    ``benchmarks/calibrate_cost.py`` to fit coefficients for your hardware,
+    settings and documents.
+    """
+    coefficients = coefficients or COEFFICIENTS
+    result = html if isinstance(html, Scan) else scan(html)
+    return (
+        coefficients["base"]
+        + coefficients["size"] * result.size
+        + coefficients["tags"] * result.tags
+        + coefficients["depth"] * result.depth
+        + coefficients["fallback_size"] * result.size * result.fallback
+    )
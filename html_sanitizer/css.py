@@ -0,0 +1,108 @@
+"""
+Parsing and cleaning of inline ``style`` attributes
+"""
+
+import re
+
+from .caches import string_cache
+
+
+__all__ = ("clean_style", "is_bold", "is_italic", "parse_style")
+
+
+_comment_re = re.compile(r"/\*.*?(?:\*/|$)", re.S)
+_property_re = re.compile(r"^-?[a-z][a-z0-9-]*$")
+_unsafe_value_re = re.compile(
+    r"[\\<>@{}]|/\*|javascript:"
+    r"|\b(?:url|expression|image|image-set|element|var|env)\s*\(",
+    re.I,
+)
+
+
+@string_cache(4096)
+def parse_style(style):
+    """
+    Parse the contents of a ``style`` attribute into a tuple of
+    ``(property, value)`` declarations
+
+    Property names are lowercased, invalid declarations are skipped.
+    Results are cached because pasted content often repeats the same style
+    strings thousands of times (except for very long strings).
+    """
+    declarations = []
+    current = []
+    quote = None
+    depth = 0
+    for char in _comment_re.sub("", style) + ";":
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(depth - 1, 0)
+        elif char == ";" and not depth:
+            name, sep, value = "".join(current).partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if sep and value and _property_re.match(name):
+                declarations.append((name, value))
+            current = []
+            continue
+        current.append(char)
+    return tuple(declarations)
+
+
+def _is_bold(value):
+    return value in {"bold", "bolder"} or (value.isdigit() and int(value) >= 600)
+
+
+def is_bold(declarations):
+    """
+    Return whether the declarations make text bold (the last ``font-weight``
+    or ``font`` declaration wins)
+    """
+    bold = False
+    for name, value in declarations:
+        if name in {"font-weight", "font"}:
+            bold = any(_is_bold(token) for token in value.lower().split())
+    return bold
+
+
+def is_italic(declarations):
+    """
+    Return whether the declarations make text italic
+    """
+    italic = False
+    for name, value in declarations:
+        if name in {"font-style", "font"}:
+            italic = bool({"italic", "oblique"} & set(value.lower().split()))
+    return italic
+
+
+def clean_style(style, properties):
+    """
+    Return ``style`` containing only the declarations allowed by
+    ``properties``, a mapping of property names to allowed values: ``None``
+    (any value which doesn't look dangerous), a set of keywords or a
+    regular expression which has to match the whole value
+    """
+    cleaned = []
+    for name, value in parse_style(style):
+        if (
+            name not in properties
+            or _unsafe_value_re.search(value)
+            or value.count("(") != value.count(")")
+        ):
+            continue
+        allowed = properties[name]
+        if allowed is None:
+            pass
+        elif isinstance(allowed, re.Pattern):
+            if not allowed.fullmatch(value):
+                continue
+        elif value.lower() not in allowed:
+            continue
+        cleaned.append(f"{name}: {value}")
+    return "; ".join(cleaned)
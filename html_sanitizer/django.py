@@ -1,34 +1,169 @@
-from functools import lru_cache
+import contextlib
+import threading
+from collections import OrderedDict
 
 from django.conf import settings
 from django.core import checks
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from django.dispatch import receiver
+from django.utils.safestring import SafeString
 
-from .sanitizer import Sanitizer
+from .sanitizer import (
+    Sanitizer,
+    SignedHTML,
+    canonical_repr,
+    sanitize_profiles as _sanitize_profiles,
+)
+
+
+def _with_signing_key(sanitizer_settings):
+    # Sanitizers only sign their output if a key has been configured
+    key = getattr(settings, "HTML_SANITIZER_SIGNING_KEY", None)
+    if key is None:
+        return sanitizer_settings
+    return {"signing_key": key, **(sanitizer_settings or {})}
 
 
 def _get_sanitizer(name="default"):
     sanitizers = getattr(settings, "HTML_SANITIZERS", {})
     if name in sanitizers:
-        return Sanitizer(sanitizers[name])
+        return Sanitizer(_with_signing_key(sanitizers[name]))
     elif name == "default":
-        return Sanitizer()
+        return Sanitizer(_with_signing_key(None))
     raise ImproperlyConfigured(
         f"Unknown sanitizer {name!r}, did you define HTML_SANITIZERS[{name!r}] in your"
         " Django settings module?"
     )
 
 
-get_sanitizer = lru_cache(maxsize=None)(_get_sanitizer)
+class SanitizerRegistry:
+    """
+    Cache of sanitizer instances
+
+    Sanitizers configured in ``HTML_SANITIZERS`` are built once (or when
+    warming the registry at startup) and kept until the setting changes.
+    Profiles registered at runtime using ``register()`` and sanitizers for
+    ad-hoc settings (``for_settings()``, e.g. per-tenant settings stored in
+    the database) are kept in a LRU cache of at most ``maxsize`` instances,
+    ``HTML_SANITIZERS_CACHE_SIZE`` or 128 by default.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.configured = {}
+        self.profiles = {}
+        self.lru = OrderedDict()
+
+    def get_maxsize(self):
+        if self.maxsize is not None:
+            return self.maxsize
+        return getattr(settings, "HTML_SANITIZERS_CACHE_SIZE", 128)
+
+    def get(self, name="default"):
+        if name in self.profiles:
+            return self._lru(("profile", name), self.profiles[name])
+        if (sanitizer := self.configured.get(name)) is not None:
+            return sanitizer
+
+        sanitizer = _get_sanitizer(name)
+        with self.lock:
+            return self.configured.setdefault(name, sanitizer)
+
+    def register(self, name, settings):
+        """
+        Register (or replace) the profile ``name`` at runtime
+        """
+        with self.lock:
+            self.profiles[name] = settings
+            self.lru.pop(("profile", name), None)
+
+    def unregister(self, name):
+        with self.lock:
+            self.profiles.pop(name, None)
+            self.lru.pop(("profile", name), None)
+
+    def for_settings(self, settings):
+        """
+        Return a sanitizer for ``settings``, reusing instances built for
+        equal settings
+        """
+        return self._lru(("settings", canonical_repr(settings)), settings)
+
+    def _lru(self, key, settings):
+        with self.lock:
+            if (sanitizer := self.lru.get(key)) is not None:
+                self.lru.move_to_end(key)
+                return sanitizer
+
+        sanitizer = Sanitizer(_with_signing_key(settings))
+        with self.lock:
+            self.lru[key] = sanitizer
+            while len(self.lru) > self.get_maxsize():
+                self.lru.popitem(last=False)
+        return sanitizer
+
+    def configured_names(self):
+        return sorted({"default", *getattr(settings, "HTML_SANITIZERS", {})})
+
+    def warm(self):
+        """
+        Build all sanitizers configured in ``HTML_SANITIZERS`` now. Invalid
+        configurations are skipped, the system check reports them.
+        """
+        for name in self.configured_names():
+            with contextlib.suppress(TypeError):
+                self.get(name)
+
+    def clear(self):
+        """
+        Forget all cached sanitizer instances
+        """
+        with self.lock:
+            self.configured.clear()
+            self.lru.clear()
+
+
+registry = SanitizerRegistry()
+
+
+def get_sanitizer(name="default"):
+    return registry.get(name)
+
+
+# Compatibility with the lru_cache which was used before
+get_sanitizer.cache_clear = registry.clear
+
+
+def sanitize_profiles(html, names):
+    """
+    Sanitize ``html`` using the sanitizers ``names`` and return a dictionary
+    mapping the names to the outputs, parsing the input only once
+    """
+    names = list(names)
+    outputs = _sanitize_profiles(html, [get_sanitizer(name) for name in names])
+    return dict(zip(names, outputs))
+
+
+@receiver(setting_changed)
+def clear_registry(*, setting, **kwargs):
+    if setting in {
+        "HTML_SANITIZERS",
+        "HTML_SANITIZERS_CACHE_SIZE",
+        "HTML_SANITIZER_SIGNING_KEY",
+    }:
+        registry.clear()
 
 
 @checks.register()
 def check_configuration(app_configs, **kwargs):
     errors = []
-    sanitizers = ["default"] + list(getattr(settings, "HTML_SANITIZERS", {}))
-    for name in sorted(set(sanitizers)):
+    for name in registry.configured_names():
         try:
-            _get_sanitizer(name)
+            registry.get(name)
         except TypeError as exc:
             errors.append(
                 checks.Error(
@@ -38,3 +173,80 @@ def check_configuration(app_configs, **kwargs):
             )
 
     return errors
+
+
+class SanitizedHTML(str):
+    """
+    HTML which has already been sanitized using the sanitizer ``sanitizer``
+    """
+
+    def __new__(cls, value, sanitizer="default"):
+        self = super().__new__(cls, value)
+        self.sanitizer = sanitizer
+        return self
+
+
+class SafeSignedHTML(SignedHTML, SafeString):
+    """
+    Signed output of a sanitizer which is marked as safe for templates
+    """
+
+
+def sanitize_safe(html, name="default"):
+    """
+    Sanitize ``html`` using the sanitizer ``name`` and return the result
+    marked as safe
+
+    If ``HTML_SANITIZER_SIGNING_KEY`` is set the result is ``SafeSignedHTML``,
+    and values returned earlier are returned as they are if their signature
+    is still valid (the settings and the signing key haven't changed), so
+    layers can call this defensively without sanitizing content again.
+    """
+    output = get_sanitizer(name).sanitize(html)
+    if isinstance(output, SafeSignedHTML):
+        return output
+    if isinstance(output, SignedHTML):
+        return SafeSignedHTML(output, output.signature)
+    return SafeString(output)
+
+
+class SanitizedHTMLDescriptor(DeferredAttribute):
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = self.field.sanitize(value)
+
+
+class SanitizedHTMLField(models.TextField):
+    """
+    Text field which sanitizes values when they are assigned
+
+    Sanitizing on assignment instead of in ``save()`` means that values are
+    also sanitized when using ``bulk_create()`` and ``bulk_update()``. Values
+    loaded from the database are assumed to be sanitized already and are not
+    processed again. ``QuerySet.update()`` bypasses the sanitizer.
+    """
+
+    descriptor_class = SanitizedHTMLDescriptor
+
+    def __init__(self, *args, sanitizer="default", **kwargs):
+        self.sanitizer = sanitizer
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.sanitizer != "default":
+            kwargs["sanitizer"] = self.sanitizer
+        return name, path, args, kwargs
+
+    def sanitize(self, value):
+        if not isinstance(value, str) or (
+            isinstance(value, SanitizedHTML) and value.sanitizer == self.sanitizer
+        ):
+            return value
+        return SanitizedHTML(
+            get_sanitizer(self.sanitizer).sanitize(value), self.sanitizer
+        )
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return SanitizedHTML(value, self.sanitizer)
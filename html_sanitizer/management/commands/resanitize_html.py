@@ -0,0 +1,144 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from html_sanitizer.django import SanitizedHTML, SanitizedHTMLField, get_sanitizer
+
+
+def init_worker():
+    django.setup()
+
+
+def sanitize_values(name, values):
+    sanitizer = get_sanitizer(name)
+    return [None if value is None else sanitizer.sanitize(value) for value in values]
+
+
+class Command(BaseCommand):
+    help = (
+        "Sanitize the values of a model field again, e.g. after changing the"
+        " sanitizer settings. Rows are processed in primary key order and"
+        " batches are committed separately, so the command can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="app_label.ModelName")
+        parser.add_argument("field", help="Name of the field to sanitize")
+        parser.add_argument(
+            "--sanitizer",
+            help="Sanitizer name (default: the field's sanitizer or 'default')",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--jobs", type=int, default=1, help="Number of worker processes"
+        )
+        parser.add_argument(
+            "--start-after", help="Only process rows with a larger primary key"
+        )
+        parser.add_argument(
+            "--state-file",
+            help="JSON file recording the last processed primary key. An"
+            " existing state file resumes an interrupted run.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the rows which would change",
+        )
+
+    def handle(self, *, model, field, **options):
+        try:
+            model = apps.get_model(model)
+            field = model._meta.get_field(field)
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc)) from exc
+
+        name = options["sanitizer"] or (
+            field.sanitizer if isinstance(field, SanitizedHTMLField) else "default"
+        )
+        get_sanitizer(name)  # Raises ImproperlyConfigured early
+
+        last = options["start_after"]
+        state_file = options["state_file"]
+        if state_file and os.path.exists(state_file):
+            with open(state_file) as f:
+                last = json.load(f)["last_pk"]
+
+        executor = None
+        if options["jobs"] > 1:
+            # Worker processes never touch the database, but shouldn't
+            # inherit open connections either.
+            connections.close_all()
+            executor = ProcessPoolExecutor(options["jobs"], initializer=init_worker)
+
+        queryset = model._default_manager.order_by("pk")
+        total = changed = 0
+        try:
+            while True:
+                rows = queryset if last is None else queryset.filter(pk__gt=last)
+                rows = list(
+                    rows.values_list("pk", field.attname)[: options["batch_size"]]
+                )
+                if not rows:
+                    break
+
+                values = [value for _pk, value in rows]
+                if executor is None:
+                    cleaned = sanitize_values(name, values)
+                else:
+                    chunk = -(-len(values) // options["jobs"])
+                    cleaned = [
+                        value
+                        for result in executor.map(
+                            sanitize_values,
+                            [name] * options["jobs"],
+                            [
+                                values[i : i + chunk]
+                                for i in range(0, len(values), chunk)
+                            ],
+                        )
+                        for value in result
+                    ]
+
+                updates = []
+                for (pk, value), clean in zip(rows, cleaned):
+                    if value != clean:
+                        instance = model(pk=pk)
+                        # Bypass SanitizedHTMLField's descriptor, which would
+                        # sanitize the value again using the field's sanitizer
+                        instance.__dict__[field.attname] = SanitizedHTML(clean, name)
+                        updates.append(instance)
+
+                if updates and not options["dry_run"]:
+                    with transaction.atomic(using=queryset.db):
+                        model._default_manager.bulk_update(updates, [field.name])
+
+                total += len(rows)
+                changed += len(updates)
+                last = rows[-1][0]
+                if state_file and not options["dry_run"]:
+                    with open(state_file, "w") as f:
+                        json.dump({"last_pk": str(last)}, f)
+                self.stdout.write(
+                    f"{total} rows processed, {changed} changed (last pk: {last})"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Completed runs do not have to be resumed, dry runs never touch the
+        # state file
+        if state_file and not options["dry_run"] and os.path.exists(state_file):
+            os.remove(state_file)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {total} rows processed, {changed} "
+                + ("would change" if options["dry_run"] else "changed")
+            )
+        )
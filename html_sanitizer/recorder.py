@@ -0,0 +1,299 @@
+"""
+Capture slow documents in production and replay them for triage
+
+A ``Recorder`` passed as the ``recorder`` setting of a sanitizer saves
+inputs which take longer than ``min_duration`` seconds or which are larger
+than ``min_size`` characters into a directory, together with the settings
+fingerprint and the time spent in each phase. The directory is a ring
+buffer: only the newest ``capacity`` documents are kept.
+
+``python -m html_sanitizer replay DIRECTORY`` re-runs the captured
+documents under a profiler and reports the phases, tags and functions which
+dominated.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+class PhaseTimer:
+    """
+    Collects the time spent in the phases of a single sanitization and, if
+    ``elements`` is true, in the tree walk per tag
+
+    Timing elements reads the clock once per element, so it's only enabled
+    when replaying documents, not for every document in production.
+    """
+
+    def __init__(self, *, elements=False):
+        self.elements = elements
+        self.phases = {}
+        self.tags = {}
+        self.counts = {}
+        self._tag = None
+        self._phase_start = self._element_start = time.perf_counter()
+
+    def phase(self, name):
+        """
+        Attribute the time since the end of the previous phase to ``name``
+        """
+        now = time.perf_counter()
+        self._flush(now)
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._phase_start
+        self._phase_start = now
+
+    def element(self, tag):
+        """
+        Start processing an element with tag ``tag`` in the tree walk
+        """
+        now = time.perf_counter()
+        self._flush(now)
+        self._tag = tag if isinstance(tag, str) else "#other"
+        self._element_start = now
+
+    def _flush(self, now):
+        if self._tag is not None:
+            self.tags[self._tag] = (
+                self.tags.get(self._tag, 0.0) + now - self._element_start
+            )
+            self.counts[self._tag] = self.counts.get(self._tag, 0) + 1
+            self._tag = None
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+
+class Recorder:
+    """
+    Bounded on-disk ring buffer of slow or large inputs
+
+    - ``directory``: Where documents are saved, one JSON file each. Created
+      if it doesn't exist.
+    - ``min_duration``: Record documents taking at least this many seconds
+      to sanitize, ``None`` disables the latency threshold.
+    - ``min_size``: Record documents with at least this many characters,
+      ``None`` (the default) disables the size threshold.
+    - ``capacity``: The number of documents kept, older documents are
+      removed.
+
+    Failing to write a document never breaks sanitizing.
+    """
+
+    def __init__(self, directory, *, min_duration=0.5, min_size=None, capacity=100):
+        self.directory = os.fspath(directory)
+        self.min_duration = min_duration
+        self.min_size = min_size
+        self.capacity = capacity
+
+    def __repr__(self):
+        return (
+            f"Recorder({self.directory!r}, min_duration={self.min_duration!r},"
+            f" min_size={self.min_size!r}, capacity={self.capacity!r})"
+        )
+
+    def should_record(self, duration, size):
+        return (self.min_duration is not None and duration >= self.min_duration) or (
+            self.min_size is not None and size >= self.min_size
+        )
+
+    def observe(self, html, timer, *, fingerprint, options=None):
+        """
+        Save ``html`` if it exceeds one of the thresholds. Returns the path
+        of the saved document or ``None``.
+        """
+        if not self.should_record(timer.total, len(html)):
+            return None
+        entry = {
+            "time": time.time(),
+            "fingerprint": fingerprint,
+            "duration": timer.total,
+            "size": len(html),
+            "phases": timer.phases,
+            "options": options or {},
+            "html": html,
+        }
+        with contextlib.suppress(OSError, ValueError):
+            return self.save(entry)
+        return None
+
+    def save(self, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.time_ns():020d}-{os.getpid()}.json"
+        # Write to a temporary file first so that readers never see
+        # partially written documents
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                # Escape non-ASCII characters so that lone surrogates, which
+                # cannot be encoded, are recorded and replayed unchanged
+                json.dump(entry, f)
+            path = os.path.join(self.directory, name)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+        self.prune()
+        return path
+
+    def paths(self):
+        """
+        Return the paths of all saved documents, oldest first
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(names)
+            if name.endswith(".json")
+        ]
+
+    def prune(self):
+        paths = self.paths()
+        for path in paths[: max(len(paths) - self.capacity, 0)]:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+    def load(self):
+        """
+        Yield ``(path, entry)`` tuples for all saved documents, oldest first
+        """
+        for path in self.paths():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    yield path, json.load(f)
+            except (FileNotFoundError, ValueError):
+                # Removed or being written by another process
+                continue
+
+
+def replay(entries, sanitizer, *, profile=True):
+    """
+    Sanitize the recorded ``(path, entry)`` tuples again and return a report
+    with the phases, tags and documents taking the most time and, if
+    ``profile`` is true, a ``pstats.Stats`` instance
+
+    Only the replay times the tree walk per tag.
+    """
+    import cProfile  # noqa: PLC0415
+    import pstats  # noqa: PLC0415
+
+    # Import lxml and warm up caches before measuring anything
+    sanitizer._sanitize("<p>warm-up</p>")
+    profiler = cProfile.Profile() if profile else None
+    report = {
+        "documents": [],
+        "phases": {},
+        "tags": {},
+        "counts": {},
+        "size": 0,
+        "other_settings": 0,
+        "stats": None,
+    }
+    for path, entry in entries:
+        timer = PhaseTimer(elements=True)
+        if profiler is not None:
+            profiler.enable()
+        try:
+            sanitizer._sanitize(entry["html"], timer=timer, **entry.get("options", {}))
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+        report["documents"].append((timer.total, entry["size"], path))
+        report["size"] += entry["size"]
+        if entry["fingerprint"] != sanitizer.fingerprint:
+            report["other_settings"] += 1
+        for key in ("phases", "tags", "counts"):
+            totals = report[key]
+            for name, value in getattr(timer, key).items():
+                totals[name] = totals.get(name, 0) + value
+
+    report["documents"].sort(reverse=True)
+    if profiler is not None and report["documents"]:
+        report["stats"] = pstats.Stats(profiler, stream=io.StringIO())
+    return report
+
+
+def format_report(report, *, limit=15):
+    lines = []
+    total = sum(duration for duration, _size, _path in report["documents"])
+    lines.append(
+        f"Replayed {len(report['documents'])} documents"
+        f" ({report['size'] / 1e3:.0f} kB) in {total:.3f}s"
+    )
+    if report["other_settings"]:
+        lines.append(
+            f"{report['other_settings']} documents were recorded with different"
+            " settings or another version of html-sanitizer"
+        )
+
+    def share(seconds):
+        return f"{seconds:9.3f}s {seconds / total if total else 0:6.1%}"
+
+    lines.extend(["", "Phases:"])
+    for name, seconds in sorted(report["phases"].items(), key=lambda item: -item[1]):
+        lines.append(f"  {name:<12} {share(seconds)}")
+
+    lines.extend(["", "Tree walk by tag:"])
+    tags = sorted(report["tags"].items(), key=lambda item: -item[1])
+    for name, seconds in tags[:limit]:
+        lines.append(f"  {name:<12} {share(seconds)} {report['counts'][name]:9} visits")
+
+    lines.extend(["", "Slowest documents:"])
+    for duration, size, path in report["documents"][:limit]:
+        lines.append(f"  {duration:9.3f}s {size / 1e3:9.0f} kB  {path}")
+
+    if report["stats"] is not None:
+        stats = report["stats"]
+        stats.stream = io.StringIO()
+        stats.sort_stats("cumulative").print_stats(limit)
+        lines.extend(["", "Profile:", stats.stream.getvalue().strip("\n")])
+
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None, *, stdout=None):
+    from .cli import load_settings  # noqa: PLC0415
+    from .sanitizer import Sanitizer  # noqa: PLC0415
+
+    parser = argparse.ArgumentParser(
+        prog="python -m html_sanitizer replay",
+        description="Replay documents captured by a Recorder under a profiler.",
+    )
+    parser.add_argument("directory", help="Directory of the recorder")
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="JSON file or Python file defining SETTINGS for the sanitizer",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=15,
+        help="Number of tags, documents and functions shown (default: 15)",
+    )
+    parser.add_argument(
+        "--no-profile", action="store_true", help="Do not run the profiler"
+    )
+    args = parser.parse_args(argv)
+    stdout = stdout or sys.stdout
+
+    sanitizer = Sanitizer(load_settings(args.config))
+    report = replay(
+        Recorder(args.directory).load(), sanitizer, profile=not args.no_profile
+    )
+    if not report["documents"]:
+        stdout.write(f"No documents recorded in {args.directory}\n")
+        return 1
+    stdout.write(format_report(report, limit=args.limit))
+    return 0
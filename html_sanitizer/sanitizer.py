@@ -1,12 +1,290 @@
+import copy
+import hashlib
+import hmac
 import re
+import threading
 import unicodedata
-from collections import deque
+from collections import Counter, namedtuple
+from functools import lru_cache, partial
+from types import CodeType, MappingProxyType, ModuleType
 
-import lxml.html
-import lxml.html.clean
+from .caches import string_cache
+from .css import clean_style, is_bold, is_italic, parse_style
+from .urls import URLPolicy
 
 
-__all__ = ("Sanitizer",)
+# lxml is only imported when it is actually needed, importing this module
+# should stay cheap for processes which never sanitize anything.
+
+__all__ = ("Sanitizer", "URLPolicy", "Violation")
+
+
+# Compiled once instead of looking them up in ``re``'s cache for every
+# element; user patterns could evict them from that cache
+_whitespace_re = re.compile(r"\s+")
+_control_characters_re = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]")
+_surrogates_re = re.compile(r"[\ud800-\udfff]")
+_list_marker_re = re.compile(r"^\s*(-|\*|&#183;)\s+")
+_empty_tag_re = re.compile(r"<([^/>]+)/>")
+_wrapper_re = re.compile(r"^<div>|</div>$")
+_xml_name_re = re.compile(r"^[A-Za-z][A-Za-z0-9_.-]*$")
+# Maximum length of the documents normalized together by ``sanitize_many``
+_batch_length = 1 << 16
+
+
+@lru_cache(maxsize=None)
+def get_block_tags():
+    """
+    Return the tags which are rendered as separate blocks in plain text
+    """
+    from lxml.html.defs import (  # noqa: PLC0415
+        block_tags,
+        font_style_tags,
+        phrase_tags,
+        special_inline_tags,
+    )
+
+    return block_tags, phrase_tags | special_inline_tags | font_style_tags
+
+
+@lru_cache(maxsize=64)
+def compile_xpath(expression):
+    import lxml.etree  # noqa: PLC0415
+
+    return lxml.etree.XPath(expression)
+
+
+# Parsers are reused, but not shared between threads because of their
+# error logs
+_parsers = threading.local()
+
+
+def _get_html_parser(name, **kwargs):
+    import lxml.html  # noqa: PLC0415
+
+    parser = getattr(_parsers, name, None)
+    if parser is None:
+        parser = lxml.html.HTMLParser(**kwargs)
+        setattr(_parsers, name, parser)
+    return parser
+
+
+# Compiled stylesheets aren't shared between threads either
+_stylesheets = threading.local()
+
+
+def _get_stylesheet(source):
+    import lxml.etree  # noqa: PLC0415
+
+    cache = getattr(_stylesheets, "cache", None)
+    if cache is None:
+        cache = _stylesheets.cache = {}
+    stylesheet = cache.get(source)
+    if stylesheet is None:
+        if len(cache) >= 64:
+            cache.clear()
+        stylesheet = cache[source] = lxml.etree.XSLT(lxml.etree.XML(source))
+    return stylesheet
+
+
+def _check_parser_errors(parser, *, resource_limits=True):
+    import lxml.etree  # noqa: PLC0415
+
+    for error in parser.error_log:
+        if (
+            not resource_limits
+            and error.type == lxml.etree.ErrorTypes.ERR_RESOURCE_LIMIT
+        ):
+            continue
+        if error.level == lxml.etree.ErrorLevels.FATAL:
+            # For example "Excessive depth in document": libxml2 silently
+            # stops parsing and the rest of the document would be lost.
+            raise ValueError(f"Fatal parser error: {error.message}")
+
+
+def parse_lxml(html):
+    """
+    Parse using lxml's HTML parser with default options
+    """
+    import lxml.html  # noqa: PLC0415
+
+    parser = _get_html_parser("lxml")
+    doc = lxml.html.fromstring(html, parser=parser)
+    _check_parser_errors(parser)
+    lxml.html.tostring(doc, encoding="utf-8")
+    return doc
+
+
+def parse_recover(html):
+    """
+    Remove characters which cannot be represented in XML and parse using a
+    recovering lxml HTML parser without resource limits, e.g. for deeply
+    nested documents
+
+    libxml2 still stops parsing at its hard limits (a depth of 2048 even
+    with ``huge_tree``); the content parsed up to then is returned, because
+    BeautifulSoup would run out of Python stack on such documents.
+    """
+    import lxml.html  # noqa: PLC0415
+
+    html = _surrogates_re.sub("\ufffd", filter_control_characters(html))
+    parser = _get_html_parser("recover", recover=True, huge_tree=True)
+    doc = lxml.html.fromstring(html, parser=parser)
+    _check_parser_errors(parser, resource_limits=False)
+    lxml.html.tostring(doc, encoding="utf-8")
+    return doc
+
+
+def parse_soup(html):
+    """
+    Parse using BeautifulSoup; slow, but handles almost anything
+    """
+    from lxml.html import soupparser  # noqa: PLC0415
+
+    return soupparser.fromstring(html)
+
+
+PARSERS = {"lxml": parse_lxml, "recover": parse_recover, "soup": parse_soup}
+
+
+@lru_cache(maxsize=None)
+def _autolink_defaults():
+    # The default link regexes and avoided elements, hosts and classes of
+    # the public ``autolink()`` function
+    import inspect  # noqa: PLC0415
+
+    from lxml_html_clean import autolink  # noqa: PLC0415
+
+    return {
+        name: parameter.default
+        for name, parameter in inspect.signature(autolink).parameters.items()
+        if parameter.default is not parameter.empty
+    }
+
+
+def _link_text(text, link_regexes, avoid_hosts, factory):
+    """
+    Split ``text`` into the text before the first link and a list of ``a``
+    elements whose tails contain the text between and after the links
+
+    Adapted from the private helper of ``lxml_html_clean.autolink()``
+    (BSD license) so that changes to its internals cannot break us.
+    """
+    leading_text = ""
+    links = []
+    while True:
+        best_match = None
+        for regex in link_regexes:
+            pos = 0
+            while (match := regex.search(text, pos)) is not None:
+                host = match.group("host")
+                if not any(host_regex.search(host) for host_regex in avoid_hosts):
+                    break
+                pos = match.end()
+            if match is not None and (
+                best_match is None or match.start() < best_match.start()
+            ):
+                best_match = match
+        if best_match is None:
+            # No more matches
+            break
+
+        link = best_match.group(0)
+        end = best_match.end()
+        if link.endswith((".", ",")):
+            # These punctuation marks shouldn't end a link
+            end -= 1
+            link = link[:-1]
+        previous_text = text[: best_match.start()]
+        if links:
+            links[-1].tail = previous_text
+        else:
+            leading_text = previous_text
+        anchor = factory("a")
+        anchor.set("href", link)
+        body = best_match.group("body") or link
+        if body.endswith((".", ",")):
+            body = body[:-1]
+        anchor.text = body
+        links.append(anchor)
+        text = text[end:]
+
+    if links:
+        links[-1].tail = text
+        return leading_text, links
+    return text, links
+
+
+def autolink_tree(
+    doc,
+    *,
+    link_regexes=None,
+    avoid_elements=None,
+    avoid_hosts=None,
+    avoid_classes=None,
+):
+    """
+    Turn URLs into links, same as ``lxml.html.clean.autolink(doc, ...)``
+
+    Instead of recursing through the whole tree and running the link
+    regexes on every text node, only text nodes containing ``://`` or ``@``
+    are considered when using the default link regexes, and they are found
+    by a single XPath query.
+    """
+    defaults = _autolink_defaults()
+    if avoid_elements is None:
+        avoid_elements = defaults["avoid_elements"]
+    if avoid_hosts is None:
+        avoid_hosts = defaults["avoid_hosts"]
+    if avoid_classes is None:
+        avoid_classes = defaults["avoid_classes"]
+
+    if link_regexes is None or link_regexes is defaults["link_regexes"]:
+        link_regexes = defaults["link_regexes"]
+        # Both default regexes require one of these substrings
+        texts = compile_xpath(
+            "descendant::text()[contains(., '://') or contains(., '@')]"
+        )(doc)
+    else:
+        texts = compile_xpath("descendant::text()")(doc)
+
+    avoided = {}
+
+    def is_avoided(element):
+        # Elements on the path from ``doc`` to ``element``, ``doc`` last
+        path = []
+        while element is not None and element not in avoided:
+            path.append(element)
+            element = None if element is doc else element.getparent()
+        result = avoided.get(element, False)
+        for element in reversed(path):
+            class_name = (element.get("class") or "").split()
+            result = avoided[element] = (
+                result
+                or element.tag in avoid_elements
+                or any(match_class in class_name for match_class in avoid_classes)
+            )
+        return result
+
+    for text in texts:
+        owner = text.getparent()
+        # Tails belong to the parent's content
+        element = owner.getparent() if text.is_tail else owner
+        if is_avoided(element):
+            continue
+
+        leading_text, children = _link_text(
+            str(text), link_regexes, avoid_hosts, factory=element.makeelement
+        )
+        if not children:
+            continue
+        if owner is element:
+            element.text = leading_text
+            element[:0] = children
+        else:
+            owner.tail = leading_text
+            index = element.index(owner)
+            element[index + 1 : index + 1] = children
 
 
 def sanitize_href(href):
@@ -39,9 +317,17 @@ typographic_whitespace_names = [
     "IDEOGRAPHIC SPACE",
 ]
 
-typographic_whitespace = "".join(
-    {unicodedata.lookup(n) for n in typographic_whitespace_names}
-)
+
+@lru_cache(maxsize=None)
+def get_typographic_whitespace():
+    return "".join({unicodedata.lookup(n) for n in typographic_whitespace_names})
+
+
+def __getattr__(name):
+    # typographic_whitespace used to be a module level constant
+    if name == "typographic_whitespace":
+        return get_typographic_whitespace()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def normalize_overall_whitespace(
@@ -64,29 +350,47 @@ def normalize_overall_whitespace(
     for ch in whitespace:
         html = html.replace(ch, " ")
     if whitespace_re is None:
-        whitespace_re = r"\s+"
+        whitespace_re = _whitespace_re
     html = re.sub(whitespace_re, " ", html)
     return html
 
 
+# Element processors may declare the tags they rename as a tuple of
+# ``(from, to)`` pairs in a ``renames`` attribute. The sanitizer only prunes
+# whitespace-only subtrees before walking the tree if all preprocessors
+# declare their renames, see ``Sanitizer.get_prune_expression``.
+# Processors which don't rename anything but only look at elements with
+# specific tags declare those as ``tags``. Unconditional renames are
+# declared as ``replaces``, the XSLT engine performs them natively, see
+# ``Sanitizer.get_stylesheet``.
+
+
 def bold_span_to_strong(element):
-    if element.tag == "span" and "bold" in element.get("style", ""):
+    if element.tag == "span" and is_bold(parse_style(element.get("style", ""))):
         element.tag = "strong"
     return element
 
 
+bold_span_to_strong.renames = (("span", "strong"),)
+
+
 def italic_span_to_em(element):
-    if element.tag == "span" and "italic" in element.get("style", ""):
+    if element.tag == "span" and is_italic(parse_style(element.get("style", ""))):
         element.tag = "em"
     return element
 
 
+italic_span_to_em.renames = (("span", "em"),)
+
+
 def tag_replacer(from_, to_):
     def replacer(element):
         if element.tag == from_:
             element.tag = to_
         return element
 
+    replacer.renames = ((from_, to_),)
+    replacer.replaces = (from_, to_)
     return replacer
 
 
@@ -102,6 +406,10 @@ def target_blank_noopener(element):
     return element
 
 
+target_blank_noopener.renames = ()
+target_blank_noopener.tags = ("a",)
+
+
 def anchor_id_to_name(element):
     if (
         element.tag == "a"
@@ -112,11 +420,15 @@ def anchor_id_to_name(element):
     return element
 
 
+anchor_id_to_name.renames = ()
+anchor_id_to_name.tags = ("a",)
+
+
 def filter_control_characters(text):
     """Filter out control characters that lxml cannot handle."""
     if not text:
         return text
-    return re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]", "", text)
+    return _control_characters_re.sub("", text)
 
 
 def normalize_whitespace_in_text_or_tail(
@@ -132,7 +444,7 @@ def normalize_whitespace_in_text_or_tail(
         return element
 
     if whitespace_re is None:
-        whitespace_re = re.compile(r"\s+")
+        whitespace_re = _whitespace_re
     if element.text:
         while True:
             text = whitespace_re.sub(" ", element.text)
@@ -150,6 +462,301 @@ def normalize_whitespace_in_text_or_tail(
     return element
 
 
+def html_to_text(doc, *, blocks, whitespace):
+    """
+    Convert a (sanitized) tree into normalized plain text
+
+    Elements in ``blocks`` are separated by blank lines, elements in
+    ``whitespace`` (such as ``<br>``) start a new line. All other whitespace
+    is collapsed into single spaces.
+    """
+    import lxml.etree  # noqa: PLC0415
+
+    # Control characters have been filtered out of all text nodes already,
+    # which makes them usable as markers for paragraph and line breaks.
+    parts = []
+    for event, element in lxml.etree.iterwalk(doc, events=("start", "end")):
+        if event == "start":
+            if element.tag in blocks:
+                parts.append("\x1e")
+            elif element.tag in whitespace:
+                parts.append("\x1f")
+            parts.append(element.text or "")
+        else:
+            if element.tag in blocks:
+                parts.append("\x1e")
+            if element is not doc:
+                parts.append(element.tail or "")
+
+    paragraphs = []
+    for block in "".join(parts).split("\x1e"):
+        lines = [" ".join(line.split()) for line in block.split("\x1f")]
+        block = "\n".join(line for line in lines if line)  # noqa: PLW2901
+        if block:
+            paragraphs.append(block)
+    return "\n\n".join(paragraphs)
+
+
+def excerpt(text, length):
+    """
+    Shorten ``text`` to at most ``length`` characters, preferably at a word
+    boundary. An ellipsis is appended if the text has been shortened.
+    """
+    text = " ".join(text.split())
+    if len(text) <= length:
+        return text
+    cut = text[: max(length - 1, 0)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip() + "\u2026"
+
+
+def prune_beyond_budget(doc, *, max_length, max_blocks, tags, separate):
+    """
+    Remove top-level elements which certainly cannot end up in the output
+    when it is truncated to ``max_length`` characters or ``max_blocks``
+    top-level elements
+
+    After the first cleaning pass sanitization removes little more than
+    whitespace and list markers, so the collapsed text without list markers
+    seen here is a close estimate of the output length which is never too
+    high. One additional element is kept after the
+    budget has been exhausted (or several, if they look mergeable) because it
+    might be merged with the previous element.
+    """
+    length = len(" ".join((doc.text or "").split()))
+    blocks = 0
+    previous = None
+    for child in doc.iterchildren():
+        if (max_length is not None and length >= max_length) or (
+            max_blocks is not None and blocks >= max_blocks
+        ):
+            # Also keep a run of elements which might be merged into one
+            while (
+                (extra := child.getnext()) is not None
+                and extra.tag == child.tag
+                and extra.tag not in separate
+                and not (child.tail or "").strip()
+            ):
+                child = extra  # noqa: PLW2901
+            while (extra := child.getnext()) is not None:
+                doc.remove(extra)
+            break
+
+        text = " ".join(child.text_content().split())
+        # The walk removes list markers, which must not count towards the
+        # budget or the estimate could be longer than the output
+        markers = sum(
+            len(match.group(1)) + 1
+            for element in child.iter("li", "p")
+            if element.text and (match := _list_marker_re.match(element.text))
+        )
+        length += max(len(text) - markers, 0)
+        length += len(" ".join((child.tail or "").split()))
+        # Only count elements which will survive as a separate block
+        if (
+            text
+            and child.tag in tags
+            and (
+                child.tag in separate
+                or previous is None
+                or previous.tag != child.tag
+                or (previous.tail or "").strip()
+            )
+        ):
+            blocks += 1
+        previous = child
+
+
+def _remove_following(element, doc):
+    while element is not doc:
+        while (nx := element.getnext()) is not None:
+            element.getparent().remove(nx)
+        element = element.getparent()
+        if element is not doc:
+            element.tail = None
+
+
+def _ignore(*args):
+    pass
+
+
+def last_descendant(element):
+    """
+    Return the last element of ``element``'s subtree in document order
+    """
+    while len(element):
+        element = element[-1]
+    return element
+
+
+def preceding(element, doc):
+    """
+    Return the element before ``element`` in document order, or ``None`` if
+    ``element`` is the first descendant of ``doc``
+
+    Visiting ``last_descendant(doc)`` and then following ``preceding()``
+    yields the same elements as ``reversed(list(doc.iterdescendants()))``
+    without creating proxies for the whole tree up front.
+    """
+    previous = element.getprevious()
+    if previous is not None:
+        return last_descendant(previous)
+    parent = element.getparent()
+    return None if parent is None or parent is doc else parent
+
+
+def truncate_tree(doc, *, max_length=None, max_blocks=None):
+    """
+    Truncate the tree to at most ``max_blocks`` top-level elements and
+    ``max_length`` characters of text
+    """
+    if max_blocks is not None and len(doc) >= max_blocks:
+        for child in doc[max_blocks:]:
+            doc.remove(child)
+        if max_blocks:
+            doc[-1].tail = None
+        else:
+            doc.text = None
+
+    if max_length is None:
+        return
+
+    import lxml.etree  # noqa: PLC0415
+
+    remaining = max_length
+    for event, element in lxml.etree.iterwalk(doc, events=("start", "end")):
+        if event == "start":
+            text = element.text or ""
+            if len(text) >= remaining:
+                element.text = text[:remaining]
+                for child in element:
+                    element.remove(child)
+                if element is not doc:
+                    element.tail = None
+                _remove_following(element, doc)
+                return
+        elif element is not doc:
+            text = element.tail or ""
+            if len(text) >= remaining:
+                element.tail = text[:remaining]
+                _remove_following(element, doc)
+                return
+        remaining -= len(text)
+
+
+Violation = namedtuple("Violation", "kind tag detail")
+
+
+class SignedHTML(str):
+    """
+    Output of a sanitizer with a ``signing_key``
+
+    ``signature`` is a HMAC over the fingerprint of the sanitizer's settings
+    and the HTML. Values loaded from storage can be signed again by passing
+    the stored signature: ``SignedHTML(html, signature)``.
+    """
+
+    def __new__(cls, value, signature):
+        self = super().__new__(cls, value)
+        self.signature = signature
+        return self
+
+    def __reduce__(self):
+        return (type(self), (str.__str__(self), self.signature))
+
+
+class _StopError(Exception):
+    pass
+
+
+class _CheckTarget:
+    """
+    Parser target which collects allowlist violations while the document is
+    being parsed, without building a tree
+    """
+
+    def __init__(self, sanitizer, *, first):
+        self.sanitizer = sanitizer
+        self.first = first
+        self.violations = []
+        # The parser always adds html and body; the div is our own wrapper.
+        self.skip = ["html", "body", "div"]
+        # One flag per open element: Did it contain anything worth keeping?
+        self.stack = []
+        # The tag of the element whose text comes next, if any
+        self.text_of = None
+
+    def violation(self, kind, tag, detail=None):
+        self.violations.append(Violation(kind, tag, detail))
+        if self.first:
+            raise _StopError
+
+    def start(self, tag, attrib):
+        if self.skip and tag == self.skip[0] and not self.stack:
+            self.skip.pop(0)
+            return
+
+        sanitizer = self.sanitizer
+        self.stack.append(False)
+        self.text_of = tag
+        if tag not in sanitizer.tags:
+            self.violation("tag", tag)
+        allowed = sanitizer.attributes.get(tag, ())
+        if (
+            tag == "a"
+            and "rel" in allowed
+            and attrib.get("target") == "_blank"
+            and "noopener" not in attrib.get("rel", "")
+            and (
+                target_blank_noopener in sanitizer.element_preprocessors
+                or target_blank_noopener in sanitizer.element_postprocessors
+            )
+        ):
+            self.violation("attribute", tag, "rel")
+        for key, value in attrib.items():
+            if key not in allowed or key.startswith("on"):
+                self.violation("attribute", tag, key)
+            elif (
+                key in sanitizer._url_attributes
+                and sanitizer._url_attributes[key](value) != value
+            ):
+                self.violation("href", tag, value)
+            elif (
+                key == "style"
+                and sanitizer._clean_style is not None
+                and parse_style(sanitizer._clean_style(value)) != parse_style(value)
+            ):
+                self.violation("style", tag, value)
+
+    def end(self, tag):
+        self.text_of = None
+        if not self.stack:
+            return
+        has_content = self.stack.pop()
+        empty = self.sanitizer.empty
+        if not has_content and tag not in empty:
+            self.violation("empty", tag)
+        if self.stack and (
+            has_content or (tag in empty and tag not in self.sanitizer.whitespace)
+        ):
+            self.stack[-1] = True
+
+    def data(self, data):
+        if self.text_of in {"li", "p"} and (match := _list_marker_re.match(data)):
+            self.violation("marker", self.text_of, match.group(1))
+        self.text_of = None
+        if self.stack and not self.sanitizer.only_whitespace_re.match(data):
+            self.stack[-1] = True
+
+    def comment(self, text):
+        self.text_of = None
+        self.violation("comment", None, text)
+
+    def close(self):
+        return self.violations
+
+
 DEFAULT_SETTINGS = {
     "tags": {
         "a",
@@ -188,9 +795,81 @@ DEFAULT_SETTINGS = {
         anchor_id_to_name,
     ],
     "element_postprocessors": [],
+    "parsers": ("lxml", "recover", "soup"),
+    "engine": "python",
+    "css_properties": None,
+    "recorder": None,
+    "signing_key": None,
 }
 
 
+def _code_digest(code):
+    """
+    Return a digest of the bytecode, constants (including nested code
+    objects) and names of ``code``
+    """
+    consts = [
+        _code_digest(const) if isinstance(const, CodeType) else canonical_repr(const)
+        for const in code.co_consts
+    ]
+    data = canonical_repr([code.co_code.hex(), consts, code.co_names])
+    return hashlib.sha256(data.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+
+
+def canonical_repr(value):
+    """
+    Return a representation of a settings value which doesn't depend on
+    ordering of sets and dictionaries or on object identities of functions
+
+    Functions are represented by their qualified name, a digest of their
+    code, their defaults and their closure cells: Two lambdas with different
+    bodies don't share a representation.
+    """
+    if isinstance(value, dict):
+        items = sorted(
+            f"{canonical_repr(k)}:{canonical_repr(v)}" for k, v in value.items()
+        )
+        return "{%s}" % ",".join(items)
+    if isinstance(value, (set, frozenset)):
+        return "set(%s)" % ",".join(sorted(map(canonical_repr, value)))
+    if isinstance(value, (list, tuple)):
+        return "[%s]" % ",".join(map(canonical_repr, value))
+    if isinstance(value, re.Pattern):
+        return f"re({value.pattern!r}, {value.flags})"
+    if callable(value) and hasattr(value, "__qualname__"):
+        # Closures such as tag_replacer("b", "strong") share their qualname
+        cells = [
+            cell.cell_contents for cell in getattr(value, "__closure__", None) or ()
+        ]
+        parts = [*cells]
+        if (code := getattr(value, "__code__", None)) is not None:
+            parts.extend(
+                [
+                    _code_digest(code),
+                    getattr(value, "__defaults__", None),
+                    getattr(value, "__kwdefaults__", None),
+                ]
+            )
+        # Bound methods depend on the state of their instance
+        owner = getattr(value, "__self__", None)
+        if owner is not None and not isinstance(owner, ModuleType):
+            parts.append(owner)
+        return "{}.{}({})".format(
+            value.__module__, value.__qualname__, ",".join(map(canonical_repr, parts))
+        )
+    return repr(value)
+
+
+def _coerce_signing_key(value):
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    elif not isinstance(value, bytes) and value is not None:
+        raise TypeError('"signing_key" must be a string or bytes')
+    if value == b"":
+        raise TypeError('"signing_key" must not be empty')
+    return value
+
+
 def coerce_to_set(value):
     if isinstance(value, set):
         return value
@@ -199,10 +878,65 @@ def coerce_to_set(value):
     raise TypeError(f"Expected a set but got value {value!r} of type {type(value)}")
 
 
+TagPlan = namedtuple(
+    "TagPlan", "allowed empty whitespace mergeable attributes clean_style urls"
+)
+TagPlan.__doc__ = """
+Decisions of the tree walk for a single tag: whether the tag is allowed,
+may be empty, is a whitespace tag or may be merged with adjacent elements,
+its allowed attributes, the style cleaner (or ``None``) and a tuple of
+``(attribute, sanitize_url)`` pairs
+"""
+
+_disallowed_tag = TagPlan(
+    allowed=False,
+    empty=False,
+    whitespace=False,
+    mergeable=False,
+    attributes=frozenset(),
+    clean_style=None,
+    urls=(),
+)
+
+
+class Plan(
+    namedtuple(
+        "Plan",
+        "fingerprint tags empty separate whitespace tag_plans"
+        " preprocessors postprocessors whitespace_re only_whitespace_re"
+        " keep_typographic_whitespace autolink add_nofollow is_mergeable"
+        " stylesheet",
+    )
+):
+    """
+    Immutable settings of a sanitizer, compiled for the tree walk
+
+    ``preprocessors`` are the preprocessors which run in the walk,
+    ``stylesheet`` is the source of the XSLT stylesheet which runs before
+    the walk when using the ``"xslt"`` engine (or ``None``). Plans are equal
+    if their fingerprints are equal.
+    """
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return isinstance(other, Plan) and self.fingerprint == other.fingerprint
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def tag(self, tag):
+        return self.tag_plans.get(tag, _disallowed_tag)
+
+
 class Sanitizer:
     def __init__(self, settings=None):
         self.__dict__.update(DEFAULT_SETTINGS)
         self.__dict__.update(settings or {})
+        self._setting_names = sorted({*DEFAULT_SETTINGS, *(settings or {})})
 
         # Allow iterables of any kind, not just sets.
         self.tags = coerce_to_set(self.tags)
@@ -215,7 +949,7 @@ class Sanitizer:
         }
 
         if self.keep_typographic_whitespace:
-            re_whitespace = r"[^\S%s]" % typographic_whitespace
+            re_whitespace = r"[^\S%s]" % get_typographic_whitespace()
         else:
             re_whitespace = r"\s"
 
@@ -249,6 +983,285 @@ class Sanitizer:
                 'Always allow "rel" when allowing "target" as anchor attribute'
             )
 
+        # Allowed style attributes are only cleaned if ``css_properties``
+        # is given, the results are cached per distinct style string.
+        self._clean_style = None
+        if self.css_properties is not None:
+            properties = {
+                name.lower(): (
+                    values
+                    if values is None or isinstance(values, re.Pattern)
+                    else frozenset(value.lower() for value in values)
+                )
+                for name, values in self.css_properties.items()
+            }
+            self._clean_style = string_cache(1024)(
+                partial(clean_style, properties=properties)
+            )
+
+        self._parsers = []
+        for parser in self.parsers:
+            if callable(parser):
+                self._parsers.append((parser.__name__, parser))
+            elif parser in PARSERS:
+                self._parsers.append((parser, PARSERS[parser]))
+            else:
+                raise TypeError(f"Unknown parser {parser!r}")
+        if not self._parsers:
+            raise TypeError('"parsers" must not be empty')
+        # Sanitizers with equal keys normalize and parse documents the same
+        # way, see ``sanitize_profiles()``
+        self._parse_key = (
+            self.keep_typographic_whitespace,
+            self.whitespace_re.pattern,
+            tuple(parser for _name, parser in self._parsers),
+        )
+        # Number of documents handled by each parser
+        self.parser_stats = Counter()
+
+        # Callables sanitizing URL attributes, returning ``None`` removes
+        # the attribute
+        if isinstance(self.sanitize_href, URLPolicy):
+            self._url_attributes = self.sanitize_href.compile()
+        else:
+            self._url_attributes = {"href": self.sanitize_href}
+
+        self._signing_key = _coerce_signing_key(self.signing_key)
+
+        if self.engine not in {"python", "xslt"}:
+            raise TypeError(f"Unknown engine {self.engine!r}")
+
+        self._prune_expression = self.get_prune_expression()
+        self.plan = self.compile_plan()
+
+    def compile_plan(self):
+        """
+        Compile the settings into a ``Plan``. Changing settings after
+        initializing the sanitizer has no effect on the plan.
+        """
+        from . import __version__  # noqa: PLC0415
+
+        # The recorder, the signing key and the engine don't influence the
+        # output (and the key must not end up in the fingerprint)
+        settings = {
+            name: getattr(self, name)
+            for name in self._setting_names
+            if name not in {"recorder", "signing_key", "engine"}
+        }
+        fingerprint = hashlib.sha256(
+            canonical_repr(
+                [
+                    __version__,
+                    f"{type(self).__module__}.{type(self).__qualname__}",
+                    settings,
+                ]
+            ).encode()
+        ).hexdigest()
+
+        tag_plans = {}
+        for tag in self.tags | self.whitespace:
+            attributes = frozenset(self.attributes.get(tag, ()))
+            tag_plans[tag] = TagPlan(
+                allowed=tag in self.tags,
+                empty=tag in self.empty,
+                whitespace=tag in self.whitespace,
+                mergeable=tag in self.tags and tag not in self.separate,
+                attributes=attributes,
+                clean_style=self._clean_style if "style" in attributes else None,
+                urls=tuple(
+                    (key, sanitize_url)
+                    for key, sanitize_url in self._url_attributes.items()
+                    if key in attributes
+                ),
+            )
+
+        stylesheet, preprocessors = None, self.element_preprocessors
+        if self.engine == "xslt":
+            stylesheet, preprocessors = self.get_stylesheet()
+
+        return Plan(
+            fingerprint=fingerprint,
+            tags=frozenset(self.tags),
+            empty=frozenset(self.empty),
+            separate=frozenset(self.separate),
+            whitespace=frozenset(self.whitespace),
+            tag_plans=MappingProxyType(tag_plans),
+            preprocessors=tuple(preprocessors),
+            postprocessors=tuple(self.element_postprocessors),
+            whitespace_re=self.whitespace_re,
+            only_whitespace_re=self.only_whitespace_re,
+            keep_typographic_whitespace=self.keep_typographic_whitespace,
+            autolink=(
+                MappingProxyType(dict(self.autolink))
+                if isinstance(self.autolink, dict)
+                else self.autolink
+            ),
+            add_nofollow=self.add_nofollow,
+            is_mergeable=self.is_mergeable,
+            stylesheet=stylesheet,
+        )
+
+    def get_stylesheet(self):  # noqa: C901
+        """
+        Return the source of an XSLT stylesheet performing structural work
+        of the tree walk natively and the preprocessors which still have to
+        run in the walk, or ``(None, preprocessors)``
+
+        The stylesheet performs the unconditional renames of preprocessors
+        such as ``tag_replacer`` (declared as ``replaces``) if they can run
+        before the preprocessors preceding them without changing the
+        result, i.e. if those don't produce or look at the tags involved.
+        It also removes attributes which aren't allowed from elements whose
+        tag is allowed and won't be changed by the remaining preprocessors,
+        unless postprocessors or a custom ``is_mergeable`` could look at
+        the attributes.
+
+        Dropping disallowed tags is left to the walk and the cleaner because
+        it changes which elements are adjacent, and whitespace-only subtrees
+        are pruned using ``get_prune_expression()``.
+        """
+        renames = {}
+        remaining = []
+        # Tags looked at and tags produced by remaining preprocessors
+        touched, produced = set(), set()
+        known = True
+        for processor in self.element_preprocessors:
+            replaces = getattr(processor, "replaces", None)
+            if (
+                known
+                and replaces is not None
+                and not touched.intersection(replaces)
+                and replaces[0] not in produced
+                and replaces[1] not in renames
+                and all(_xml_name_re.match(tag) for tag in replaces)
+            ):
+                from_, to_ = replaces
+                for source, target in renames.items():
+                    if target == from_:
+                        renames[source] = to_
+                renames.setdefault(from_, to_)
+                continue
+
+            remaining.append(processor)
+            processor_renames = getattr(processor, "renames", None)
+            processor_tags = getattr(processor, "tags", None)
+            if processor_renames is None or (
+                not processor_renames and processor_tags is None
+            ):
+                # Might look at any element
+                known = False
+            else:
+                touched.update(processor_tags or ())
+                for from_, to_ in processor_renames:
+                    touched.add(from_)
+                    produced.add(to_)
+
+        if not known or produced.intersection(renames):
+            # Elements are processed again after merging, the renames have
+            # to be idempotent
+            renames, remaining = {}, self.element_preprocessors
+            for processor in remaining:
+                touched.update(getattr(processor, "tags", None) or ())
+                touched.update(
+                    from_ for from_, _to in getattr(processor, "renames", ())
+                )
+
+        strip = {}
+        if (
+            known
+            and not self.element_postprocessors
+            and self.is_mergeable is Sanitizer.is_mergeable
+        ):
+            for tag in self.tags - touched:
+                attributes = self.attributes.get(tag, ())
+                if _xml_name_re.match(tag) and all(
+                    _xml_name_re.match(name) for name in attributes
+                ):
+                    strip[tag] = attributes
+
+        if not renames and not strip:
+            return None, self.element_preprocessors
+
+        def apply_templates(tag):
+            attributes = strip.get(tag)
+            if attributes is None:
+                select = "@*|node()"
+            else:
+                select = "|".join(
+                    [*(f"@{name}" for name in sorted(attributes)), "node()"]
+                )
+            return f'<xsl:apply-templates select="{select}"/>'
+
+        # The walk never visits the root element, only match its descendants
+        templates = [
+            (
+                '<xsl:template match="@*|node()">'
+                '<xsl:copy><xsl:apply-templates select="@*|node()"/></xsl:copy>'
+                "</xsl:template>"
+            )
+        ]
+        for source, target in sorted(renames.items()):
+            templates.append(
+                f'<xsl:template match="*/{source}"><{target}>'
+                f"{apply_templates(target)}</{target}></xsl:template>"
+            )
+        for tag in sorted(strip.keys() - renames.keys()):
+            templates.append(
+                f'<xsl:template match="*/{tag}"><xsl:copy>'
+                f"{apply_templates(tag)}</xsl:copy></xsl:template>"
+            )
+        source = (
+            '<xsl:stylesheet version="1.0"'
+            ' xmlns:xsl="http://www.w3.org/1999/XSL/Transform">'
+            '<xsl:output encoding="UTF-8"/>' + "".join(templates) + "</xsl:stylesheet>"
+        )
+        return source, remaining
+
+    def get_prune_expression(self):
+        """
+        Return an XPath expression matching whitespace-only elements which
+        the tree walk would remove completely, or ``None`` if that cannot be
+        determined in advance
+
+        Elements which are allowed to be ``empty`` (or which preprocessors
+        may rename to such a tag) are kept, as are their ancestors. Unknown
+        preprocessors (without a ``renames`` attribute) could do anything,
+        so nothing is pruned in that case.
+        """
+        keep = set(self.empty)
+        renames = []
+        for processor in self.element_preprocessors:
+            if not hasattr(processor, "renames"):
+                return None
+            renames.extend(processor.renames)
+
+        while True:
+            sources = {from_ for from_, to_ in renames if to_ in keep} - keep
+            if not sources:
+                break
+            keep |= sources
+
+        if not all(_xml_name_re.match(tag) for tag in keep):
+            return None
+
+        expression = "descendant::*[not(normalize-space())]"
+        if keep:
+            tags = " or ".join(f"self::{tag}" for tag in sorted(keep))
+            expression += f"[not(descendant-or-self::*[{tags}])]"
+        return expression
+
+    @property
+    def fingerprint(self):
+        """
+        A stable hash of the effective settings and of the package version,
+        e.g. for deciding whether stored results are still current
+
+        Settings values without a stable representation (such as instances
+        of classes without a ``__repr__``) lead to a different fingerprint
+        for every sanitizer.
+        """
+        return self.plan.fingerprint
+
     @staticmethod
     def is_mergeable(e1, e2):
         """
@@ -257,39 +1270,274 @@ class Sanitizer:
         """
         return True
 
-    def sanitize(self, html):  # noqa: C901 -- I know.
+    def sanitize(self, html, *, max_length=None, max_blocks=None):
         """
         Clean HTML code from ugly copy-pasted CSS and empty elements
 
         Removes everything not explicitly allowed in ``self.allowed_tags``.
 
+        ``max_length`` limits the output to the given number of text
+        characters, ``max_blocks`` to the given number of top-level elements.
+        The truncated output is still well-formed, and content which cannot
+        end up in the output anyway isn't processed at all.
+
+        Sanitizers with a ``signing_key`` return ``SignedHTML`` and return
+        ``SignedHTML`` values with a valid signature as they are, without
+        sanitizing them again.
+
         Requires ``lxml`` and, for especially broken HTML, ``beautifulsoup4``.
         """
+        if self._signing_key is not None:
+            if (
+                isinstance(html, SignedHTML)
+                and max_length is None
+                and max_blocks is None
+                and self.verify(html)
+            ):
+                return html
+            return self.sign(
+                self._record(html, max_length=max_length, max_blocks=max_blocks)
+            )
+        return self._record(html, max_length=max_length, max_blocks=max_blocks)
+
+    def _record(self, html, *, max_length=None, max_blocks=None):
+        if self.recorder is None:
+            return self._sanitize(html, max_length=max_length, max_blocks=max_blocks)
+
+        from .recorder import PhaseTimer  # noqa: PLC0415
+
+        timer = PhaseTimer()
+        output = self._sanitize(
+            html, max_length=max_length, max_blocks=max_blocks, timer=timer
+        )
+        options = {"max_length": max_length, "max_blocks": max_blocks}
+        self.recorder.observe(
+            html,
+            timer,
+            fingerprint=self.fingerprint,
+            options={key: value for key, value in options.items() if value is not None},
+        )
+        return output
+
+    def sign(self, html):
+        """
+        Return ``html`` as ``SignedHTML``, assuming that it has been produced
+        by this sanitizer
+        """
+        return SignedHTML(html, self._signature(html))
+
+    def verify(self, html, signature=None):
+        """
+        Return whether ``html`` has been signed by a sanitizer with the same
+        settings and signing key. The signature defaults to the signature of
+        ``SignedHTML`` values.
+        """
+        if signature is None:
+            signature = getattr(html, "signature", None)
+        if (
+            self._signing_key is None
+            or not isinstance(signature, str)
+            or not signature.isascii()
+        ):
+            return False
+        return hmac.compare_digest(self._signature(html), signature)
+
+    def _signature(self, html):
+        if self._signing_key is None:
+            raise TypeError('Signing requires a "signing_key"')
+        message = f"{self.fingerprint}\x00{html}".encode("utf-8", "surrogatepass")
+        return hmac.new(self._signing_key, message, hashlib.sha256).hexdigest()
+
+    def _sanitize(self, html, *, max_length=None, max_blocks=None, timer=None):
+        if max_length is None and max_blocks is None:
+            doc, _parser = self._sanitize_tree(html, timer=timer)
+        else:
+            doc, _parser = self._sanitize_tree(
+                html, max_length=max_length, max_blocks=max_blocks, timer=timer
+            )
+            truncate_tree(doc, max_length=max_length, max_blocks=max_blocks)
+            if timer is not None:
+                timer.phase("truncate")
+        output = self._serialize(doc)
+        if timer is not None:
+            timer.phase("serialize")
+        return output
+
+    def sanitize_many(self, htmls):
+        """
+        Sanitize each of ``htmls`` and return a list of the outputs, the same
+        as calling ``sanitize()`` for each document
+
+        Small documents are normalized in batches before parsing them one by
+        one, which saves a bit of overhead when sanitizing many fragments.
+        Sanitizers with a ``recorder`` or a ``signing_key`` process the
+        documents one by one.
+        """
+        if self.recorder is not None or self._signing_key is not None:
+            return [self.sanitize(html) for html in htmls]
+
+        outputs = []
+        for html in self._normalize_many(htmls):
+            doc, _parser = self._parse(html)
+            self._clean(doc)
+            outputs.append(self._serialize(doc))
+        return outputs
+
+    def sanitize_to_text(self, html):
+        """
+        Sanitize ``html`` and return the normalized plain text of the result
+        """
+        return self.sanitize_outputs(html, ("text",))["text"]
+
+    def sanitize_outputs(self, html, outputs=("html", "text"), *, excerpt_length=200):
+        """
+        Sanitize ``html`` once and return a dictionary containing all
+        requested outputs built from the same tree:
+
+        - ``"html"``: The sanitized HTML, same as ``sanitize()``
+        - ``"text"``: Normalized plain text, see ``html_to_text()``
+        - ``"excerpt"``: The text shortened to at most ``excerpt_length``
+          characters
+        - ``"parser"``: The name of the parser which handled the document
+        """
+        unknown = set(outputs) - {"html", "text", "excerpt", "parser"}
+        if unknown:
+            raise ValueError(f"Unknown outputs: {unknown!r}")
+
+        doc, parser = self._sanitize_tree(html)
+        result = {}
+        if "parser" in outputs:
+            result["parser"] = parser
+        if "html" in outputs:
+            result["html"] = self._serialize(doc)
+            if self._signing_key is not None:
+                result["html"] = self.sign(result["html"])
+        if "text" in outputs or "excerpt" in outputs:
+            block_tags, inline_tags = get_block_tags()
+            text = html_to_text(
+                doc,
+                blocks=self.plan.separate - inline_tags | self.plan.tags & block_tags,
+                whitespace=self.plan.whitespace,
+            )
+            if "text" in outputs:
+                result["text"] = text
+            if "excerpt" in outputs:
+                result["excerpt"] = excerpt(text, excerpt_length)
+        return result
+
+    def check(self, html, *, first=False):
+        """
+        Return a list of ``Violation`` tuples for everything in ``html`` which
+        ``sanitize()`` would remove or rewrite because of the allowlists:
+        Disallowed tags (including scripts and styles), attributes and hrefs,
+        empty elements and comments, as well as ``rel`` attributes missing
+        ``noopener`` and list markers at the start of paragraphs
+
+        No tree is built and nothing is serialized. ``first=True`` stops at
+        the first violation. Element preprocessors and postprocessors other
+        than ``target_blank_noopener`` aren't considered.
+        """
+        import lxml.etree  # noqa: PLC0415
+
+        target = _CheckTarget(self, first=first)
+        parser = lxml.etree.HTMLParser(target=target)
+        try:
+            lxml.etree.fromstring("<div>%s</div>" % self._normalize(html), parser)
+        except _StopError:
+            pass
+        except Exception as exc:
+            return [Violation("parser", None, str(exc))]
+        return target.violations
+
+    def is_clean(self, html):
+        """
+        Return whether ``html`` passes ``check()`` without any violations
+        """
+        return not self.check(html, first=True)
 
+    def _normalize(self, html):
         # normalize unicode
         if self.keep_typographic_whitespace:
             html = unicodedata.normalize("NFC", html)
         else:
             html = unicodedata.normalize("NFKC", html)
 
-        html = normalize_overall_whitespace(
+        return normalize_overall_whitespace(
             html,
             keep_typographic_whitespace=self.keep_typographic_whitespace,
             whitespace_re=self.whitespace_re,
         )
+
+    def _normalize_many(self, htmls):
+        """
+        Normalize ``htmls`` like ``_normalize()``, joining small documents
+        using NUL characters so that each batch is normalized using a single
+        call. NUL doesn't combine with neighbouring characters, isn't
+        whitespace and isn't produced by the normalization, so the results
+        are the same. Documents containing NUL are normalized one by one.
+        """
+        batch, length = [], 0
+        for html in htmls:
+            if "\x00" in html or len(html) >= _batch_length:
+                yield from self._normalize_batch(batch)
+                batch, length = [], 0
+                yield self._normalize(html)
+                continue
+            if length + len(html) >= _batch_length:
+                yield from self._normalize_batch(batch)
+                batch, length = [], 0
+            batch.append(html)
+            length += len(html) + 1
+        yield from self._normalize_batch(batch)
+
+    def _normalize_batch(self, batch):
+        if len(batch) > 1:
+            normalized = self._normalize("\x00".join(batch)).split("\x00")
+            if len(normalized) == len(batch):
+                return normalized
+        return [self._normalize(html) for html in batch]
+
+    def _parse(self, html):
+        """
+        Parse using the first parser of the ``parsers`` chain which succeeds
+        and return the tree and the name of that parser
+        """
         html = "<div>%s</div>" % html
-        try:
-            doc = lxml.html.fromstring(html)
-            lxml.html.tostring(doc, encoding="utf-8")
-        except Exception:  # We could and maybe should be more specific...
-            from lxml.html import soupparser  # noqa: PLC0415
+        for index, (name, parser) in enumerate(self._parsers):
+            try:
+                doc = parser(html)
+            except Exception:  # We could and maybe should be more specific...
+                if index == len(self._parsers) - 1:
+                    raise
+            else:
+                self.parser_stats[name] += 1
+                return doc, name
+
+    def _sanitize_tree(self, html, *, max_length=None, max_blocks=None, timer=None):
+        html = self._normalize(html)
+        if timer is not None:
+            timer.phase("normalize")
+        doc, parser = self._parse(html)
+        if timer is not None:
+            timer.phase("parse")
+        self._clean(doc, max_length=max_length, max_blocks=max_blocks, timer=timer)
+        return doc, parser
+
+    def _clean(  # noqa: C901 -- I know.
+        self, doc, *, max_length=None, max_blocks=None, timer=None
+    ):
+        import lxml.html.clean  # noqa: PLC0415
 
-            doc = soupparser.fromstring(html)
+        plan = self.plan
+        # ``phase`` collects timings for the recorder, ``mark_element`` the
+        # time per tag when replaying
+        phase = timer.phase if timer is not None else _ignore
+        mark_element = timer.element if timer is not None and timer.elements else None
 
         lxml.html.clean.Cleaner(
             remove_unknown_tags=False,
             # Remove style *tags* if not explicitly allowed
-            style="style" not in self.tags,
+            style="style" not in plan.tags,
             # Do not strip out style attributes; we still need the style
             # information to convert spans into em/strong tags
             safe_attrs_only=False,
@@ -297,30 +1545,83 @@ class Sanitizer:
             # Do not strip all form tags; we will filter them below
             forms=False,
         )(doc)
-
-        # walk the tree recursively, because we want to be able to remove
-        # previously emptied elements completely
-        backlog = deque(doc.iterdescendants())
-
-        while True:
-            try:
-                element = backlog.pop()
-            except IndexError:
-                break
-
-            for processor in self.element_preprocessors:
+        phase("clean")
+
+        if max_length is not None or max_blocks is not None:
+            prune_beyond_budget(
+                doc,
+                max_length=max_length,
+                max_blocks=max_blocks,
+                tags=plan.tags,
+                separate=plan.separate,
+            )
+            phase("budget")
+
+        if plan.stylesheet is not None:
+            # Replace the children of ``doc`` in place; the moved elements
+            # become ``HtmlElement`` instances again once they're looked up
+            # through ``doc``. The stylesheet never changes ``doc.text``,
+            # which may contain control characters lxml refuses to assign.
+            result = _get_stylesheet(plan.stylesheet)(doc).getroot()
+            doc[:] = list(result)
+            del result
+            phase("xslt")
+
+        if self._prune_expression:
+            # Remove whitespace-only subtrees up front instead of visiting
+            # each of their elements. The result is the same as dropping the
+            # elements one by one, innermost first, in the walk below. The
+            # first child of ``doc`` is only emptied and left to the walk,
+            # because ``doc.text`` isn't normalized again.
+            skip_until = None
+            for element in compile_xpath(self._prune_expression)(doc):
+                if skip_until is not None:
+                    # Descendants of an already pruned element
+                    if element is skip_until:
+                        skip_until = None
+                    continue
+                if len(element):
+                    skip_until = last_descendant(element)
+                    element.text = "".join(element.itertext())
+                    del element[:]
+                if element.getprevious() is None and element.getparent() is doc:
+                    continue
+                normalize_whitespace_in_text_or_tail(
+                    element,
+                    whitespace_re=plan.whitespace_re,
+                    keep_typographic_whitespace=plan.keep_typographic_whitespace,
+                )
+                element.drop_tag()
+            phase("prune")
+
+        # walk the tree in reverse document order, because we want to be
+        # able to remove previously emptied elements completely. Elements
+        # are only ever modified or removed after they have been visited, so
+        # the next element can be determined lazily. Setting ``next_element``
+        # to ``element`` processes the current element again.
+        only_whitespace = plan.only_whitespace_re.match
+        next_element = last_descendant(doc) if len(doc) else None
+
+        while next_element is not None:
+            element = next_element
+            next_element = preceding(element, doc)
+            if mark_element is not None:
+                mark_element(element.tag)
+
+            for processor in plan.preprocessors:
                 element = processor(element)
 
             element = normalize_whitespace_in_text_or_tail(
                 element,
-                whitespace_re=self.whitespace_re,
-                keep_typographic_whitespace=self.keep_typographic_whitespace,
+                whitespace_re=plan.whitespace_re,
+                keep_typographic_whitespace=plan.keep_typographic_whitespace,
             )
+            tag = plan.tag(element.tag)
 
             # remove empty tags if they are not explicitly allowed
             if (
-                (not element.text or self.only_whitespace_re.match(element.text))
-                and element.tag not in self.empty
+                (not element.text or only_whitespace(element.text))
+                and not tag.empty
                 and not len(element)
             ):
                 element.drop_tag()
@@ -328,10 +1629,10 @@ class Sanitizer:
 
             # remove tags which only contain whitespace and/or <br>s
             if (
-                element.tag not in self.empty
-                and self.only_whitespace_re.match(element.text or "")
-                and {e.tag for e in element} <= self.whitespace
-                and all(self.only_whitespace_re.match(e.tail or "") for e in element)
+                not tag.empty
+                and only_whitespace(element.text or "")
+                and {e.tag for e in element} <= plan.whitespace
+                and all(only_whitespace(e.tail or "") for e in element)
             ):
                 element.drop_tree()
                 continue
@@ -346,47 +1647,45 @@ class Sanitizer:
                 # remove list markers, maybe copy-pasted from word or whatever
                 if element.text:
                     element.text = filter_control_characters(
-                        re.sub(r"^\s*(-|\*|&#183;)\s+", "", element.text)
+                        _list_marker_re.sub("", element.text)
                     )
 
-            elif element.tag in self.whitespace:
+            elif tag.whitespace:
                 # Drop the next element if
                 # 1. it is a <br> too and 2. there is no content in-between
                 nx = element.getnext()
                 if (
                     nx is not None
                     and nx.tag == element.tag
-                    and (
-                        not element.tail or self.only_whitespace_re.match(element.tail)
-                    )
+                    and (not element.tail or only_whitespace(element.tail))
                 ):
                     nx.drop_tag()
 
             if not element.text:
                 # No text before first child and first child is a <br>: Drop it
-                first = list(element)[0] if list(element) else None
-                if first is not None and first.tag in self.whitespace:
+                first = element[0] if len(element) else None
+                if first is not None and first.tag in plan.whitespace:
                     first.drop_tag()
                     # Maybe we have more than one <br>
-                    backlog.append(element)
+                    next_element = element
                     continue
 
-            if element.tag in (self.tags - self.separate):
+            if tag.mergeable:
                 # Check whether we should merge adjacent elements of the same
                 # tag type
                 nx = element.getnext()
                 if (
-                    self.only_whitespace_re.match(element.tail or "")
+                    only_whitespace(element.tail or "")
                     and nx is not None
                     and nx.tag == element.tag
-                    and self.is_mergeable(element, nx)
+                    and plan.is_mergeable(element, nx)
                 ):
                     # Yes, we should. Tail is empty, that is, no text between
                     # tags of a mergeable type.
                     if nx.text:
                         if len(element):
-                            list(element)[-1].tail = "{}{}".format(
-                                list(element)[-1].tail or "",
+                            element[-1].tail = "{}{}".format(
+                                element[-1].tail or "",
                                 nx.text,
                             )
                         else:
@@ -402,49 +1701,120 @@ class Sanitizer:
                     nx.getparent().remove(nx)
 
                     # Process element again
-                    backlog.append(element)
+                    next_element = element
                     continue
 
-            for processor in self.element_postprocessors:
-                element = processor(element)
-
-            # remove all attributes which are not explicitly allowed
-            allowed = self.attributes.get(element.tag, [])
-            for key in element.keys():  # noqa: SIM118 (do not remove .keys())
-                if key not in allowed:
-                    del element.attrib[key]
-
-            # Clean hrefs so that they are benign
-            href = element.get("href")
-            if href is not None:
-                element.set("href", self.sanitize_href(href))
+            if plan.postprocessors:
+                for processor in plan.postprocessors:
+                    element = processor(element)
+                tag = plan.tag(element.tag)
+
+            # Disallowed tags are removed by the second cleaner below, their
+            # attributes only matter to the autolinker (avoid_classes)
+            if tag.allowed or plan.autolink:
+                # remove all attributes which are not explicitly allowed
+                keys = element.keys()
+                if not tag.attributes:
+                    if keys:
+                        element.attrib.clear()
+                elif not tag.attributes.issuperset(keys):
+                    for key in keys:
+                        if key not in tag.attributes:
+                            del element.attrib[key]
+
+                # Only keep allowed CSS declarations
+                if tag.clean_style is not None:
+                    style = element.get("style")
+                    if style is not None:
+                        style = tag.clean_style(style)
+                        if style:
+                            element.set("style", style)
+                        else:
+                            del element.attrib["style"]
+
+                # Clean hrefs (and other URLs) so that they are benign
+                for key, sanitize_url in tag.urls:
+                    url = element.get(key)
+                    if url is None:
+                        continue
+                    url = sanitize_url(url)
+                    if url is None:
+                        del element.attrib[key]
+                    else:
+                        element.set(key, url)
 
             element = normalize_whitespace_in_text_or_tail(
                 element,
-                whitespace_re=self.whitespace_re,
-                keep_typographic_whitespace=self.keep_typographic_whitespace,
+                whitespace_re=plan.whitespace_re,
+                keep_typographic_whitespace=plan.keep_typographic_whitespace,
             )
+        phase("walk")
 
-        if self.autolink is True:
-            lxml.html.clean.autolink(doc)
-        elif isinstance(self.autolink, dict):
-            lxml.html.clean.autolink(doc, **self.autolink)
+        # The autolinker runs after the walk because merging adjacent
+        # elements may join the text of a single URL
+        if plan.autolink is True:
+            autolink_tree(doc)
+            phase("autolink")
+        elif isinstance(plan.autolink, MappingProxyType):
+            autolink_tree(doc, **plan.autolink)
+            phase("autolink")
 
         # Run cleaner again, but this time with even more strict settings
         lxml.html.clean.Cleaner(
-            allow_tags=self.tags,
+            allow_tags=plan.tags,
             remove_unknown_tags=False,
             safe_attrs_only=False,  # Our attributes allowlist is sufficient.
-            add_nofollow=self.add_nofollow,
+            add_nofollow=plan.add_nofollow,
             forms=False,
         )(doc)
+        phase("cleanup")
+
+    def _serialize(self, doc):
+        import lxml.html  # noqa: PLC0415
 
         html = lxml.html.tostring(doc, encoding="unicode")
 
         # add a space before the closing slash in empty tags
-        html = re.sub(r"<([^/>]+)/>", r"<\1 />", html)
+        html = _empty_tag_re.sub(r"<\1 />", html)
 
         # remove wrapping tag needed by XML parser
-        html = re.sub(r"^<div>|</div>$", "", html)
+        html = _wrapper_re.sub("", html)
 
         return html
+
+
+def sanitize_profiles(html, sanitizers):
+    """
+    Sanitize ``html`` using each of ``sanitizers`` and return a list of the
+    outputs in the same order
+
+    The input is only normalized and parsed once for all sanitizers which
+    do that the same way (same ``keep_typographic_whitespace`` and
+    ``parsers`` settings), each of them cleans its own copy of the tree. The
+    outputs are the same as those of ``sanitize()``. Recorders aren't
+    consulted.
+    """
+    sanitizers = list(sanitizers)
+    outputs = [None] * len(sanitizers)
+    groups = {}
+    for index, sanitizer in enumerate(sanitizers):
+        if isinstance(html, SignedHTML) and sanitizer.verify(html):
+            # Already sanitized, see ``Sanitizer.sanitize()``
+            outputs[index] = html
+        else:
+            groups.setdefault(sanitizer._parse_key, []).append(index)
+
+    for indices in groups.values():
+        first = sanitizers[indices[0]]
+        doc, parser = first._parse(first._normalize(html))
+        for position, index in enumerate(indices, 1):
+            sanitizer = sanitizers[index]
+            if position > 1:  # ``_parse`` counted the first one
+                sanitizer.parser_stats[parser] += 1
+            # The last sanitizer may clean the parsed tree itself
+            tree = doc if position == len(indices) else copy.deepcopy(doc)
+            sanitizer._clean(tree)
+            outputs[index] = sanitizer._serialize(tree)
+            if sanitizer._signing_key is not None:
+                outputs[index] = sanitizer.sign(outputs[index])
+    return outputs
@@ -0,0 +1,298 @@
+"""
+Local sanitization service and client
+
+The server listens on a Unix socket or on a localhost TCP port and speaks
+newline delimited JSON. Requests look like this::
+
+    {"id": 1, "profile": "default", "html": "<p>Hello</p>"}
+
+and are answered in order, with the same ``id``::
+
+    {"id": 1, "html": "<p>Hello</p>"}
+    {"id": 2, "error": "Unknown profile 'strict'"}
+
+``{"op": "reload"}`` reloads the profiles, ``{"op": "ping"}`` answers with
+``{"pong": true}``. Clients may send many requests without waiting for the
+responses. When too many responses are pending, the server stops reading
+from the connection until the client catches up.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import runpy
+import signal
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .cli import load_settings
+from .sanitizer import Sanitizer
+
+
+def load_profiles(path):
+    """
+    Load a mapping of profile names to settings from a JSON file or from the
+    ``PROFILES`` variable of a Python file. ``"default"`` is always defined.
+    """
+    profiles = {}
+    if path is not None:
+        if path.endswith(".py"):
+            profiles = runpy.run_path(path)["PROFILES"]
+        else:
+            profiles = load_settings(path)
+    return {"default": None, **profiles}
+
+
+# Per process state, initialized by init_worker()
+_sanitizers = {}
+
+
+def init_worker(path):
+    _sanitizers.clear()
+    for name, settings in load_profiles(path).items():
+        _sanitizers[name] = sanitizer = Sanitizer(settings)
+        # Import lxml and warm up caches before the first real request
+        sanitizer.sanitize("<p>warm-up</p>")
+
+
+def ready():
+    return os.getpid()
+
+
+def sanitize_with_profile(profile, html):
+    try:
+        sanitizer = _sanitizers[profile]
+    except KeyError:
+        raise LookupError(f"Unknown profile {profile!r}") from None
+    return sanitizer.sanitize(html)
+
+
+class Server:
+    def __init__(self, profiles=None, *, jobs=1, max_pending=64, limit=2**26):
+        self.profiles = profiles
+        self.jobs = jobs
+        self.max_pending = max_pending
+        self.limit = limit
+        self.executor = self.create_executor()
+        self.server = None
+        self.path = None
+        self.connections = {}
+
+    def create_executor(self):
+        # Fail early (in the server process) on invalid settings
+        for settings in load_profiles(self.profiles).values():
+            Sanitizer(settings)
+        executor = ProcessPoolExecutor(
+            self.jobs, initializer=init_worker, initargs=(self.profiles,)
+        )
+        # Workers are only started when tasks are submitted. Start all of
+        # them now so that they are warmed up before the first request.
+        for _ in range(self.jobs):
+            executor.submit(ready)
+        return executor
+
+    def reload(self):
+        """
+        Start a new pool using the current profiles. Requests already
+        submitted to the old pool are still answered by it.
+        """
+        executor, self.executor = self.executor, self.create_executor()
+        executor.shutdown(wait=False)
+
+    async def start(self, *, path=None, host="127.0.0.1", port=0):
+        if path is not None:
+            self.path = path
+            self.server = await asyncio.start_unix_server(
+                self.handle, path, limit=self.limit
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle, host, port, limit=self.limit
+            )
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    def dispatch(self, line):
+        """
+        Return a future for the response to a single request line
+        """
+        loop = asyncio.get_running_loop()
+        response = loop.create_future()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("op") == "ping":
+                response.set_result({"id": request_id, "pong": True})
+            elif request.get("op") == "reload":
+                self.reload()
+                response.set_result({"id": request_id, "reloaded": True})
+            else:
+                future = loop.run_in_executor(
+                    self.executor,
+                    sanitize_with_profile,
+                    request.get("profile", "default"),
+                    request["html"],
+                )
+                future.add_done_callback(
+                    lambda future: response.set_result(
+                        {"id": request_id, "error": str(future.exception())}
+                        if future.exception()
+                        else {"id": request_id, "html": future.result()}
+                    )
+                )
+        except Exception as exc:
+            response.set_result({"id": request_id, "error": str(exc)})
+        return response
+
+    async def handle(self, reader, writer):
+        self.connections[asyncio.current_task()] = writer
+        pending = asyncio.Queue(self.max_pending)
+
+        async def respond():
+            while (response := await pending.get()) is not None:
+                writer.write(json.dumps(await response).encode() + b"\n")
+                await writer.drain()
+
+        responder = asyncio.create_task(respond())
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    # Blocks when too many responses are pending (backpressure)
+                    await pending.put(self.dispatch(line))
+            await pending.put(None)
+            await responder
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            responder.cancel()
+            writer.close()
+            self.connections.pop(asyncio.current_task(), None)
+
+
+class Client:
+    """
+    Blocking client for the sanitization service
+    """
+
+    def __init__(self, path=None, *, host="127.0.0.1", port=None, timeout=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.socket.settimeout(timeout)
+        self.file = self.socket.makefile("rwb")
+        self.next_id = 0
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def send(self, request):
+        self.file.write(json.dumps(request).encode() + b"\n")
+
+    def receive(self, *, raise_errors=True):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the server")
+        response = json.loads(line)
+        if raise_errors and "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def request(self, request):
+        self.send(request)
+        self.file.flush()
+        return self.receive()
+
+    def sanitize(self, html, profile="default"):
+        return self.sanitize_many([html], profile)[0]
+
+    def sanitize_many(self, htmls, profile="default", *, window=32):
+        """
+        Sanitize many documents, keeping up to ``window`` requests in flight
+        """
+        responses = []
+        in_flight = 0
+        for html in htmls:
+            self.next_id += 1
+            self.send({"id": self.next_id, "profile": profile, "html": html})
+            in_flight += 1
+            if in_flight >= window:
+                self.file.flush()
+                responses.append(self.receive(raise_errors=False))
+                in_flight -= 1
+        self.file.flush()
+        responses.extend(self.receive(raise_errors=False) for _ in range(in_flight))
+
+        # Only raise after all responses have been read, the connection
+        # stays usable that way.
+        for response in responses:
+            if "error" in response:
+                raise ValueError(response["error"])
+        return [response["html"] for response in responses]
+
+    def reload(self):
+        return self.request({"op": "reload"})
+
+    def ping(self):
+        return self.request({"op": "ping"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m html_sanitizer serve",
+        description="Serve sanitization requests on a local socket.",
+    )
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket", help="Path of the Unix socket")
+    address.add_argument("--port", type=int, help="TCP port on localhost")
+    parser.add_argument(
+        "--profiles",
+        help="JSON file or Python file defining PROFILES, a mapping of"
+        " profile names to sanitizer settings",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=64,
+        help="Pending responses per connection before reading pauses",
+    )
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = Server(args.profiles, jobs=args.jobs, max_pending=args.max_pending)
+        await server.start(path=args.socket, port=args.port)
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, server.reload)
+        stop = loop.create_future()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set_result, None)
+        sys.stderr.write(f"Serving on {args.socket or f'127.0.0.1:{args.port}'}\n")
+        await stop
+        await server.close()
+
+    asyncio.run(serve())
+    return 0
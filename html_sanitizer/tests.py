@@ -1,6 +1,41 @@
-from unittest import TestCase
-
-from .sanitizer import Sanitizer
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from unittest import TestCase, skipIf, skipUnless
+
+from .cli import default_file_mode, main, write_file
+from .cost import Scan, estimate_cost, scan
+from .css import is_bold, is_italic, parse_style
+from .recorder import Recorder, replay
+from .sanitizer import (
+    Sanitizer,
+    SignedHTML,
+    URLPolicy,
+    Violation,
+    autolink_tree,
+    last_descendant,
+    preceding,
+    sanitize_profiles,
+    tag_replacer,
+    target_blank_noopener,
+)
+from .server import Client, Server
+
+
+try:
+    import django
+except ImportError:  # pragma: no cover
+    django = None
 
 
 default_sanitizer = Sanitizer()
@@ -255,6 +290,282 @@ class SanitizerTestCase(TestCase):
             sanitizer=sanitizer,
         )
 
+    def test_autolink_tree(self):
+        import copy  # noqa: PLC0415
+
+        import lxml.html  # noqa: PLC0415
+        import lxml.html.clean  # noqa: PLC0415
+
+        doc = lxml.html.fromstring(
+            "<div>http://a.org/ <p>Mail mailto:x@y.org, or visit"
+            " https://b.org/x. <strong>http://c.org</strong> http://d.org</p>"
+            "<pre>http://e.org</pre> http://f.org <p class='x nolink'>"
+            "http://g.org <em>http://h.org</em></p> https://localhost/"
+            "<a href='#'>http://i.org</a> http://j.org</div>"
+        )
+        for options in (
+            {},
+            {"avoid_classes": ["x"], "avoid_elements": ["strong"]},
+            {"avoid_hosts": []},
+        ):
+            with self.subTest(options=options):
+                expected = copy.deepcopy(doc)
+                lxml.html.clean.autolink(expected, **options)
+                linked = copy.deepcopy(doc)
+                autolink_tree(linked, **options)
+                self.assertEqual(
+                    lxml.html.tostring(linked), lxml.html.tostring(expected)
+                )
+
+    def test_url_policy(self):
+        policy = URLPolicy(
+            deny_hosts={"*.tracker.example"},
+            attributes={
+                "src": {
+                    "schemes": {"https"},
+                    "allow_hosts": {"cdn.example.com", "*.cdn.example.com"},
+                    "relative": False,
+                    "replacement": None,
+                },
+            },
+        )
+        for url, expected in [
+            ("https://example.com/", "https://example.com/"),
+            ("/about/", "/about/"),
+            ("page.html#top", "page.html#top"),
+            ("mailto:info@example.com", "mailto:info@example.com"),
+            ("javascript:alert(1)", "#"),
+            (" \x01JaVa\tScRiPt:alert(1)", "#"),
+            ("data:text/html,x", "#"),
+            ("https://www.tracker.example/", "#"),
+            ("//www.tracker.example/", "#"),
+            ("/\\www.tracker.example/", "#"),
+            ("\\/\\www.tracker.example/", "#"),
+            ("https://www.tracker.example./", "#"),
+            ("https://www%2Etracker.example/", "#"),
+            ("https://WWW.TRACKER.EXAMPLE/", "#"),
+            ("http://\uff57ww.tracker.example/", "#"),
+            ("https:www.tracker.example/x", "#"),
+            ("http:/\\www.tracker.example/", "#"),
+            ("http://[::1", "#"),
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(policy(url), expected)
+
+        self.assertEqual(
+            policy("https://a.cdn.example.com/x.png", "src"),
+            "https://a.cdn.example.com/x.png",
+        )
+        self.assertIsNone(policy("http://cdn.example.com/x.png", "src"))
+        self.assertIsNone(policy("https://example.com/x.png", "src"))
+        self.assertIsNone(policy("/x.png", "src"))
+        self.assertIsNone(policy("https:evil.com/x.png", "src"))
+        self.assertIsNone(policy("https:/evil.com/x.png", "src"))
+        self.assertIsNone(policy("https:///evil.com/x.png", "src"))
+        self.assertIsNone(policy("https://evil%2Ecom/x.png", "src"))
+        self.assertEqual(
+            policy("https://CDN.example.com./x.png", "src"),
+            "https://CDN.example.com./x.png",
+        )
+
+        sanitizer = Sanitizer(
+            {
+                "tags": {"a", "img", "p"},
+                "attributes": {"a": ("href",), "img": ("src", "alt")},
+                "empty": {"a", "img"},
+                "separate": {"a", "img", "p"},
+                "sanitize_href": policy,
+            }
+        )
+        self.assertEqual(
+            sanitizer.sanitize(
+                '<p><a href="https://x.tracker.example/">a</a>'
+                '<img src="https://cdn.example.com/a.png" alt="a">'
+                '<img src="/b.png" alt="b"></p>'
+            ),
+            '<p><a href="#">a</a><img src="https://cdn.example.com/a.png" alt="a">'
+            '<img alt="b"></p>',
+        )
+        self.assertEqual(
+            sanitizer.check('<p><img src="/b.png"></p>'),
+            [Violation("href", "img", "/b.png")],
+        )
+        # Equal policies give equal fingerprints
+        self.assertEqual(
+            Sanitizer({"sanitize_href": URLPolicy(deny_hosts=["a", "b"])}).fingerprint,
+            Sanitizer({"sanitize_href": URLPolicy(deny_hosts={"b", "a"})}).fingerprint,
+        )
+
+    def test_css_properties(self):
+        self.assertEqual(
+            parse_style(
+                "COLOR: red; ; font-family: 'a;b'; background: url(x;y); broken"
+            ),
+            (("color", "red"), ("font-family", "'a;b'"), ("background", "url(x;y)")),
+        )
+        self.assertTrue(is_bold(parse_style("font-weight: 700")))
+        self.assertTrue(is_bold(parse_style("font: bold 12px Arial")))
+        self.assertFalse(is_bold(parse_style("font-weight: bold; font-weight: normal")))
+        self.assertFalse(is_bold(parse_style("color: red /* bold */")))
+        self.assertTrue(is_italic(parse_style("font-style: oblique")))
+        self.assertFalse(is_italic(parse_style("font-family: italic-sans")))
+
+        sanitizer = Sanitizer(
+            {
+                "tags": {"p", "span", "strong"},
+                "attributes": {"p": ("style",), "span": ("style",)},
+                "empty": set(),
+                "separate": {"p"},
+                "css_properties": {
+                    "text-align": {"left", "center", "right"},
+                    "color": re.compile(r"#[0-9a-f]{3,6}|[a-z]+", re.IGNORECASE),
+                    "margin-left": None,
+                },
+            }
+        )
+        self.run_tests(
+            [
+                (
+                    '<p style="TEXT-ALIGN: Center;color:#f00;font-size:12pt">a</p>',
+                    '<p style="text-align: Center; color: #f00">a</p>',
+                ),
+                (
+                    '<p style="text-align: justify; color: rgb(0,0,0)">a</p>',
+                    "<p>a</p>",
+                ),
+                (
+                    '<p style="margin-left: expression(alert(1))">a</p>',
+                    "<p>a</p>",
+                ),
+                (
+                    '<p>a <span style="font-weight: 700; color: red">b</span></p>',
+                    "<p>a <strong>b</strong></p>",
+                ),
+            ],
+            sanitizer=sanitizer,
+        )
+        self.assertEqual(
+            sanitizer.check('<p style="color: red; float: left">a</p>'),
+            [Violation("style", "p", "color: red; float: left")],
+        )
+        self.assertTrue(sanitizer.is_clean('<p style="color:red">a</p>'))
+
+    def test_plan(self):
+        sanitizer = Sanitizer()
+        plan = sanitizer.plan
+        self.assertEqual(plan, Sanitizer().plan)
+        self.assertEqual(hash(plan), hash(Sanitizer().plan))
+        self.assertNotEqual(plan, Sanitizer({"separate": {"p"}}).plan)
+        self.assertEqual(plan.fingerprint, sanitizer.fingerprint)
+
+        self.assertTrue(plan.tag("strong").mergeable)
+        self.assertFalse(plan.tag("p").mergeable)
+        self.assertTrue(plan.tag("br").empty)
+        self.assertTrue(plan.tag("br").whitespace)
+        self.assertEqual(
+            plan.tag("a").attributes, {"href", "name", "target", "title", "rel"}
+        )
+        self.assertEqual([key for key, _ in plan.tag("a").urls], ["href"])
+        self.assertEqual(plan.tag("p").urls, ())
+        self.assertFalse(plan.tag("script").allowed)
+
+        with self.assertRaises(AttributeError):
+            plan.tags = frozenset()
+        with self.assertRaises(TypeError):
+            plan.tag_plans["script"] = plan.tag("p")
+
+        # Settings are frozen when initializing the sanitizer
+        sanitizer.tags = sanitizer.tags | {"h5"}
+        self.assertEqual(sanitizer.sanitize("<h5>a</h5>"), "a")
+        sanitizer.autolink = True
+        sanitizer.add_nofollow = True
+        sanitizer.is_mergeable = lambda e1, e2: False
+        self.assertEqual(
+            sanitizer.sanitize("<strong>a</strong><strong>b</strong> https://x.ch"),
+            "<strong>ab</strong> https://x.ch",
+        )
+
+    def test_cost(self):
+        self.assertEqual(
+            scan("<p>a<p>b<ul><li>c<li>d<br/><img src=x></ul></p>"),
+            Scan(size=47, tags=7, depth=3, fallback=False),
+        )
+        for html, fallback in [
+            ("<span>" * 300 + "x", True),
+            ("<p>\ud800</p>", True),
+            ("<div>" * 100 + "x", False),
+        ]:
+            with self.subTest(html=html[:20]):
+                sanitizer = Sanitizer()
+                sanitizer.sanitize(html)
+                self.assertEqual(scan(html).fallback, fallback)
+                self.assertEqual("lxml" not in sanitizer.parser_stats, fallback)
+
+        # Long text runs are found in linear time
+        self.assertFalse(scan(("x" * 9_000_000 + "<p>") * 2).fallback)
+        self.assertTrue(scan("<p>" + "x" * 10_000_000 + "</p>").fallback)
+        # Unclosed tags are only scanned once, too
+        for html in ["<a " * 200_000, "<" + "a" * 200_000, "<a/" * 200_000]:
+            with self.subTest(html=html[:20]):
+                self.assertEqual(scan(html).tags, 0)
+
+        small = "<p>Hello <b>World</b></p>"
+        self.assertLess(estimate_cost(small), estimate_cost(small * 100))
+        self.assertEqual(estimate_cost(small), estimate_cost(scan(small)))
+        self.assertEqual(
+            estimate_cost(
+                small,
+                coefficients={
+                    "base": 1,
+                    "size": 0,
+                    "tags": 1,
+                    "depth": 0,
+                    "fallback_size": 0,
+                },
+            ),
+            3,
+        )
+
+    def test_memory_soak(self):
+        sanitizer = Sanitizer(
+            {
+                "tags": {"a", "img", "p", "strong"},
+                "attributes": {"a": ("href",), "img": ("src",), "p": ("style",)},
+                "empty": {"img"},
+                "separate": {"a", "img", "p"},
+                "css_properties": {"color": None},
+                "sanitize_href": URLPolicy(
+                    attributes={"src": {"schemes": {"data"}}}, cache_size=64
+                ),
+                "autolink": True,
+            }
+        )
+
+        def run(start, stop):
+            for i in range(start, stop):
+                sanitizer.sanitize(
+                    f"<p style='color: #{i % 50:06x}'><b>{i}</b> www.x{i}.com</p>"
+                    f"<a href='https://example.com/{i}'>x</a>\ud800"
+                    f"<img src='data:image/png;base64,{'A' * 5000}{i}'>"
+                )
+
+        # Fill the caches first
+        run(0, 100)
+        tracemalloc.start()
+        try:
+            run(100, 200)
+            before = tracemalloc.get_traced_memory()[0]
+            run(200, 500)
+            growth = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        self.assertLess(growth, 50_000)
+
+        # Long values are not kept alive by the caches
+        info = parse_style.cache_info()
+        parse_style("color: red;" + " " * 5000)
+        self.assertEqual(parse_style.cache_info().currsize, info.currsize)
+
     def test_14_classes(self):
         """Class attributes should not be treated specially"""
         sanitizer = Sanitizer(
@@ -700,3 +1011,967 @@ git commit
                 ),
             ]
         )
+
+    def test_sanitize_outputs(self):
+        html = (
+            "<h1>Title</h1><p>Hello   <b>world</b>,<br><br> second line</p>"
+            "<ul><li>one</li><li>two</li></ul><script>alert(1)</script>"
+        )
+        outputs = default_sanitizer.sanitize_outputs(
+            html, ("html", "text", "excerpt"), excerpt_length=16
+        )
+        self.assertEqual(outputs["html"], default_sanitizer.sanitize(html))
+        self.assertEqual(
+            outputs["text"], "Title\n\nHello world,\nsecond line\n\none\n\ntwo"
+        )
+        self.assertEqual(outputs["excerpt"], "Title Hello…")
+        self.assertEqual(
+            default_sanitizer.sanitize_to_text(html),
+            outputs["text"],
+        )
+        self.assertEqual(default_sanitizer.sanitize_to_text("   "), "")
+        self.assertEqual(
+            default_sanitizer.sanitize_outputs("short", ("excerpt",)),
+            {"excerpt": "short"},
+        )
+
+        with self.assertRaisesRegex(ValueError, "Unknown outputs"):
+            default_sanitizer.sanitize_outputs(html, ("pdf",))
+
+    def test_reverse_document_order(self):
+        import lxml.html  # noqa: PLC0415
+
+        doc = lxml.html.fromstring(
+            "<div><p>a<b>b<i>c</i></b><br>d</p><ul><li>e</li><li><p>f</p></li></ul>"
+            "<!-- comment --><h1></h1></div>"
+        )
+        visited = []
+        element = last_descendant(doc) if len(doc) else None
+        while element is not None:
+            visited.append(element)
+            element = preceding(element, doc)
+        self.assertEqual(visited, list(reversed(list(doc.iterdescendants()))))
+
+    def test_prune_whitespace_only_subtrees(self):
+        sanitizer = Sanitizer()
+        self.assertIn("self::br", sanitizer._prune_expression)
+        self.assertNotIn("self::span", sanitizer._prune_expression)
+        # Preprocessors may rename spans and <b> to strong
+        expression = Sanitizer({"empty": {"strong"}})._prune_expression
+        self.assertIn("self::span", expression)
+        self.assertIn("self::b ", expression)
+        self.assertIsNone(
+            Sanitizer(
+                {"element_preprocessors": [lambda element: element]}
+            )._prune_expression
+        )
+
+        html = (
+            "<p>a<span> <font> <b>\n</b></font> </span>b</p>"
+            "<div><span> </span><span> <o:p></o:p> </span></div><p>c</p>"
+            "<p><span> <br> </span></p>"
+        )
+        walking = Sanitizer()
+        walking._prune_expression = None
+        self.assertEqual(sanitizer.sanitize(html), "<p>a b</p> <p>c</p>")
+        self.assertEqual(sanitizer.sanitize(html), walking.sanitize(html))
+
+    def test_sanitize_profiles(self):
+        strict = Sanitizer(
+            {"tags": {"p"}, "empty": set(), "separate": set(), "attributes": {}}
+        )
+        typographic = Sanitizer({"keep_typographic_whitespace": True})
+        sanitizers = [default_sanitizer, strict, typographic, strict]
+        for html in [
+            "<p>Hello <b>World</b>\xa0<a href='javascript:x'>x</a></p>",
+            "<p>" + "<span>" * 300 + "deep" + "</span>" * 300 + "</p>",
+            "<ul><li>- <p>a</p></li></ul>www.example.com",
+            "",
+        ]:
+            with self.subTest(html=html[:20]):
+                self.assertEqual(
+                    sanitize_profiles(html, sanitizers),
+                    [sanitizer.sanitize(html) for sanitizer in sanitizers],
+                )
+
+        sanitizer = Sanitizer()
+        sanitize_profiles("<p>a</p>", [sanitizer, Sanitizer(), sanitizer])
+        self.assertEqual(sanitizer.parser_stats, {"lxml": 2})
+
+    def test_sanitize_many(self):
+        htmls = [
+            "<p>Hello&nbsp;<b>World</b></p>\r\n",
+            "\u0301a combining mark at the start",
+            "e\u0301 and the \ufb01 ligature\xa0",
+            "NUL \x00 characters",
+            "<p>" + "large " * 20000 + "</p>",
+            "",
+            "lone surrogate \ud800",
+            "<ul><li>- item</li></ul>",
+        ]
+        for sanitizer in [
+            default_sanitizer,
+            Sanitizer({"keep_typographic_whitespace": True}),
+            Sanitizer({"signing_key": "secret"}),
+        ]:
+            with self.subTest(sanitizer=sanitizer):
+                expected = [sanitizer.sanitize(html) for html in htmls]
+                self.assertEqual(sanitizer.sanitize_many(htmls), expected)
+                self.assertEqual(sanitizer.sanitize_many(iter(htmls)), expected)
+                self.assertEqual(
+                    list(sanitizer._normalize_many(htmls)),
+                    [sanitizer._normalize(html) for html in htmls],
+                )
+        self.assertEqual(default_sanitizer.sanitize_many([]), [])
+
+    def test_signing(self):
+        sanitizer = Sanitizer({"signing_key": "secret"})
+        output = sanitizer.sanitize("<b>bold</b><script>x</script>")
+        self.assertIsInstance(output, SignedHTML)
+        self.assertEqual(output, "<strong>bold</strong>")
+        self.assertTrue(sanitizer.verify(output))
+        self.assertIs(sanitizer.sanitize(output), output)
+        self.assertEqual(sanitizer.fingerprint, default_sanitizer.fingerprint)
+
+        # Stored values can be signed again
+        stored = SignedHTML(str(output), output.signature)
+        self.assertIs(sanitizer.sanitize(stored), stored)
+        self.assertTrue(sanitizer.verify(str(output), output.signature))
+        self.assertTrue(sanitizer.verify(pickle.loads(pickle.dumps(output))))
+
+        # Truncation still happens
+        self.assertEqual(
+            sanitizer.sanitize(output, max_length=2), "<strong>bo</strong>"
+        )
+
+        # Other keys, other settings, forged values and invalid signatures
+        for other, value in [
+            (Sanitizer({"signing_key": b"other"}), output),
+            (Sanitizer({"signing_key": "secret", "add_nofollow": True}), output),
+            (sanitizer, SignedHTML("<script>x</script>", output.signature)),
+            (sanitizer, SignedHTML(str(output), "\xe4")),
+        ]:
+            with self.subTest(value=value):
+                self.assertFalse(other.verify(value))
+                self.assertIsNot(other.sanitize(value), value)
+        self.assertEqual(
+            sanitizer.sanitize(SignedHTML("<script>x</script>", output.signature)), ""
+        )
+
+        # Signatures depend on the code of functions in the settings
+        strict = Sanitizer(
+            {
+                "sanitize_href": lambda href: (
+                    href if href.startswith("https://ok.example/") else "#"
+                ),
+                "signing_key": "k",
+            }
+        )
+        loose = Sanitizer({"sanitize_href": lambda href: href, "signing_key": "k"})
+        self.assertNotEqual(strict.fingerprint, loose.fingerprint)
+        html = '<a href="http://evil.example/">x</a>'
+        self.assertEqual(strict.sanitize(loose.sanitize(html)), '<a href="#">x</a>')
+
+        # Other outputs are signed as well
+        html = "<b>bold</b><script>x</script>"
+        self.assertEqual(
+            sanitizer.sanitize_outputs(html, ("html",))["html"].signature,
+            output.signature,
+        )
+        outputs = sanitize_profiles(html, [sanitizer, default_sanitizer])
+        self.assertEqual(outputs[0].signature, output.signature)
+        self.assertNotIsInstance(outputs[1], SignedHTML)
+        self.assertIs(sanitize_profiles(output, [sanitizer])[0], output)
+
+        self.assertFalse(default_sanitizer.verify(output))
+        self.assertNotIsInstance(default_sanitizer.sanitize("<p>a</p>"), SignedHTML)
+        with self.assertRaises(TypeError):
+            Sanitizer({"signing_key": 42})
+        with self.assertRaises(TypeError):
+            Sanitizer({"signing_key": ""})
+
+    def test_xslt_engine(self):
+        stylesheet, preprocessors = Sanitizer().get_stylesheet()
+        self.assertIn('<xsl:template match="*/b"><strong>', stylesheet)
+        self.assertIn('<xsl:template match="*/form"><p>', stylesheet)
+        # Looks at the style attribute of spans, looks at <a> tags
+        self.assertNotIn('match="*/span"', stylesheet)
+        self.assertNotIn('match="*/a"', stylesheet)
+        self.assertEqual(len(preprocessors), 4)
+
+        self.assertIsNone(
+            Sanitizer(
+                {"engine": "xslt", "element_preprocessors": [lambda element: element]}
+            ).plan.stylesheet
+        )
+        with self.assertRaisesRegex(TypeError, "Unknown engine 'c'"):
+            Sanitizer({"engine": "c"})
+
+        tags = ["p", "strong", "b", "em", "i", "span", "br", "a", "h1", "ul", "li"]
+        tags += ["div", "font", "o:p", "td", "form", "u", "sub", "hr"]
+        attributes = [
+            "",
+            ' style="font-weight:bold"',
+            ' style="font-style:italic"',
+            ' href="http://example.com"',
+            ' href="javascript:x"',
+            ' target="_blank"',
+            ' class="c"',
+            ' id="a" title="t"',
+            ' name="n" onclick="x"',
+        ]
+        texts = ["x", "yz", " ", "\n", "\xa0", "&nbsp;", "&amp;", "&#8203;"]
+        texts += ["\x01", "\x0b", "\u2009", "- z", "* ", "1. a"]
+        texts += ["www.example.com ", "<!-- c -->", "<?php x ?>"]
+
+        def generate(rng, depth=0):
+            parts = []
+            for _ in range(rng.randint(0, 4)):
+                if depth > 4 or rng.random() < 0.35:
+                    parts.append(rng.choice(texts))
+                else:
+                    tag = rng.choice(tags)
+                    parts.append(
+                        f"<{tag}{rng.choice(attributes)}>"
+                        + generate(rng, depth + 1)
+                        + ("" if tag in {"br", "hr"} else f"</{tag}>")
+                    )
+            return "".join(parts)
+
+        def outcome(sanitizer, html, **kwargs):
+            # lxml refuses some control characters in both engines when
+            # joining text, e.g. while removing comments
+            try:
+                return sanitizer.sanitize(html, **kwargs)
+            except ValueError as exc:
+                return type(exc)
+
+        for settings in [
+            {},
+            {"autolink": True, "keep_typographic_whitespace": True},
+            {"attributes": {"a": ("href", "name", "target", "rel", "id")}},
+            {
+                "tags": {"p", "strong", "div", "span"},
+                "attributes": {"span": ("class",)},
+                "empty": set(),
+                "separate": set(),
+                "element_preprocessors": [
+                    tag_replacer("b", "strong"),
+                    tag_replacer("strong", "span"),
+                    target_blank_noopener,
+                    tag_replacer("div", "p"),
+                ],
+            },
+        ]:
+            python = Sanitizer(settings)
+            xslt = Sanitizer({**settings, "engine": "xslt"})
+            self.assertIsNotNone(xslt.plan.stylesheet)
+            self.assertEqual(python.plan, xslt.plan)
+            rng = random.Random(42)
+            for _ in range(300):
+                html = rng.choice(texts) + generate(rng)
+                with self.subTest(settings=settings, html=html):
+                    for budget in [{}, {"max_blocks": 2}, {"max_length": 5}]:
+                        self.assertEqual(
+                            outcome(xslt, html, **budget),
+                            outcome(python, html, **budget),
+                        )
+
+    def test_parsers(self):
+        deep = "<p>" + "<span>" * 300 + "x</span>" + "</span>" * 299 + "<p>after</p>"
+
+        sanitizer = Sanitizer()
+        self.assertEqual(
+            sanitizer.sanitize_outputs(deep, ("html", "parser")),
+            {"html": "<p>x</p><p>after</p>", "parser": "recover"},
+        )
+        self.assertEqual(
+            sanitizer.sanitize_outputs("<p>a</p>", ("parser",)), {"parser": "lxml"}
+        )
+        self.assertEqual(sanitizer.parser_stats, {"recover": 1, "lxml": 1})
+
+        with self.assertRaisesRegex(ValueError, "Excessive depth"):
+            Sanitizer({"parsers": ["lxml"]}).sanitize(deep)
+
+        # libxml2 stops at a depth of 2048 even without resource limits, but
+        # the content parsed up to there is kept
+        deeper = "<p>before</p>" + "<span>" * 5000 + "x" + "</span>" * 5000
+        self.assertEqual(
+            sanitizer.sanitize_outputs(deeper, ("html", "parser")),
+            {"html": "<p>before</p>", "parser": "recover"},
+        )
+
+        calls = []
+
+        def parser(html):
+            calls.append(html)
+            raise ValueError("Nope")
+
+        sanitizer = Sanitizer({"parsers": [parser, "soup"]})
+        self.assertEqual(sanitizer.sanitize("<p>a</p>"), "<p>a</p>")
+        self.assertEqual(calls, ["<div><p>a</p></div>"])
+        self.assertEqual(sanitizer.parser_stats, {"soup": 1})
+
+        with self.assertRaisesRegex(TypeError, "Unknown parser 'html5'"):
+            Sanitizer({"parsers": ["html5"]})
+
+    def test_truncation(self):
+        html = (
+            "<p>Hello <b>world</b> this is long</p><p>Second paragraph</p>"
+            "<h2>a</h2> <h2>b</h2> <h2>c</h2><p>x</p>" * 50
+        )
+        self.assertEqual(default_sanitizer.sanitize(html, max_length=0), "")
+        self.assertEqual(
+            default_sanitizer.sanitize(html, max_length=16),
+            "<p>Hello <strong>world</strong> this</p>",
+        )
+        self.assertEqual(
+            default_sanitizer.sanitize(html, max_length=40),
+            "<p>Hello <strong>world</strong> this is long</p><p>Second paragraph</p>",
+        )
+        self.assertEqual(
+            default_sanitizer.sanitize(html, max_blocks=3),
+            "<p>Hello <strong>world</strong> this is long</p><p>Second paragraph</p>"
+            "<h2>a b c</h2>",
+        )
+        self.assertEqual(
+            default_sanitizer.sanitize("intro <p>a</p> tail <p>b</p>", max_blocks=1),
+            "intro <p>a</p>",
+        )
+        # List markers which the walk removes don't count
+        self.assertEqual(
+            default_sanitizer.sanitize("<p>* x</p>" * 10, max_length=6),
+            "<p>x</p>" * 6,
+        )
+        self.assertEqual(
+            default_sanitizer.sanitize(
+                "<ul>" + "<li>- ab</li>" * 10 + "</ul>", max_length=8
+            ),
+            "<ul>" + "<li>ab</li>" * 4 + "</ul>",
+        )
+
+        short = "<p>Hello <b>world</b></p>"
+        self.assertEqual(
+            default_sanitizer.sanitize(short, max_length=100, max_blocks=10),
+            default_sanitizer.sanitize(short),
+        )
+
+    def test_check(self):
+        clean = (
+            '<p>Hello <strong>world</strong><br>and <a href="/x">link</a></p>'
+            "<hr><ul><li>one</li></ul>"
+        )
+        self.assertEqual(default_sanitizer.sanitize(clean), clean)
+        self.assertEqual(default_sanitizer.check(clean), [])
+        self.assertTrue(default_sanitizer.is_clean(clean))
+
+        self.assertEqual(
+            default_sanitizer.check(
+                '<div class="x"><p onclick="x()">a</p><p> <br> </p>'
+                '<a href="javascript:alert(1)">b</a><!-- c --><script>d</script>'
+            ),
+            [
+                Violation("tag", "div", None),
+                Violation("attribute", "div", "class"),
+                Violation("attribute", "p", "onclick"),
+                Violation("empty", "p", None),
+                Violation("href", "a", "javascript:alert(1)"),
+                Violation("comment", None, " c "),
+                Violation("tag", "script", None),
+            ],
+        )
+        self.assertEqual(
+            default_sanitizer.check("<p></p><div></div>", first=True),
+            [Violation("empty", "p", None)],
+        )
+        self.assertFalse(default_sanitizer.is_clean("<b>bold</b>"))
+
+        # Rewrites which aren't caused by the allowlists
+        for html, violations in [
+            ('<a target="_blank">x</a>', [Violation("attribute", "a", "rel")]),
+            ('<a target="_blank" rel="noopener">x</a>', []),
+            ("<p>* y</p>", [Violation("marker", "p", "*")]),
+            ("<ul><li>- y</li></ul>", [Violation("marker", "li", "-")]),
+            ("<p><strong>x</strong> * y</p>", []),
+        ]:
+            with self.subTest(html=html):
+                self.assertEqual(default_sanitizer.check(html), violations)
+                self.assertEqual(
+                    default_sanitizer.sanitize(html) == html, not violations
+                )
+
+    def test_import_time(self):
+        """Importing the package shouldn't import lxml or build tables"""
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, html_sanitizer, html_sanitizer.sanitizer as s;"
+                " print(sorted(m for m in sys.modules"
+                " if m.split('.')[0] in {'lxml', 'lxml_html_clean', 'bs4'}));"
+                " print(s.get_typographic_whitespace.cache_info().currsize)",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.split("\n"), ["[]", "0", ""])
+
+    def test_import_time_budget(self):
+        """
+        Importing the package should cost less than half of what importing
+        lxml.html costs
+
+        lxml.html is imported first so that html_sanitizer is only charged
+        for its own modules and the standard library modules lxml doesn't
+        need. Bytecode is cached in a temporary directory first so that
+        compiling the sources isn't measured.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, "PYTHONPYCACHEPREFIX": tmp}
+            env.pop("PYTHONDONTWRITEBYTECODE", None)
+            code = "import lxml.html, html_sanitizer"
+            subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+            timings = {"lxml.html": [], "html_sanitizer": []}
+            for _ in range(3):
+                result = subprocess.run(
+                    [sys.executable, "-X", "importtime", "-c", code],
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                # import time: self [us] | cumulative | imported package
+                for line in result.stderr.splitlines():
+                    _self, cumulative, name = line.split("|")
+                    if name.strip() in timings and not name.startswith("  "):
+                        timings[name.strip()].append(int(cumulative))
+
+        self.assertLess(
+            min(timings["html_sanitizer"]), min(timings["lxml.html"]) / 2, timings
+        )
+
+
+class CLITestCase(TestCase):
+    def run_main(self, argv):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = main(argv, stdout=stdout, stderr=stderr)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "in")
+            os.makedirs(os.path.join(source, "sub"))
+            for name, html in [
+                ("a.html", "<p>a <b>b</b></p>"),
+                ("sub/b.html", "<div>c</div>"),
+                ("sub/c.txt", "<div>ignored</div>"),
+            ]:
+                with open(os.path.join(source, name), "w") as f:
+                    f.write(html)
+
+            output = os.path.join(tmp, "out")
+            status, stdout, stderr = self.run_main(
+                [source, "--output-dir", output, "--jobs", "2"]
+            )
+            self.assertEqual(status, 0)
+            self.assertEqual(stdout, "")
+            self.assertIn("Sanitized 2 of 2 documents", stderr)
+            self.assertEqual(
+                sorted(os.listdir(output)), ["a.html", "sub"], os.listdir(output)
+            )
+            with open(os.path.join(output, "a.html")) as f:
+                self.assertEqual(f.read(), "<p>a <strong>b</strong></p>")
+            with open(os.path.join(output, "sub", "b.html")) as f:
+                self.assertEqual(f.read(), "c")
+
+            status, stdout, stderr = self.run_main([source, "--in-place", "-q"])
+            self.assertEqual((status, stdout, stderr), (0, "", ""))
+            with open(os.path.join(source, "sub", "b.html")) as f:
+                self.assertEqual(f.read(), "c")
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.html")
+            write_file(os.path.join(tmp, "sub", "b.html"), b"b")
+            self.assertEqual(
+                os.stat(os.path.join(tmp, "sub", "b.html")).st_mode & 0o777,
+                default_file_mode(),
+            )
+
+            with open(path, "w") as f:
+                f.write("<p>original</p>")
+            os.chmod(path, 0o640)
+            write_file(path, b"<p>new</p>")
+            with open(path) as f:
+                self.assertEqual(f.read(), "<p>new</p>")
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+            # A failing write leaves the file and the directory untouched
+            with self.assertRaises(TypeError):
+                write_file(path, "not bytes")
+            with open(path) as f:
+                self.assertEqual(f.read(), "<p>new</p>")
+            self.assertEqual(sorted(os.listdir(tmp)), ["a.html", "sub"])
+
+    def test_ndjson(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = os.path.join(tmp, "config.json")
+            with open(config, "w") as f:
+                json.dump(
+                    {"tags": ["p"], "empty": [], "separate": [], "attributes": {}},
+                    f,
+                )
+            records = os.path.join(tmp, "records.ndjson")
+            with open(records, "w") as f:
+                f.write('{"id": 1, "post": {"body": "<p><b>x</b></p>"}}\n')
+                f.write('{"id": 2, "post": {}}\n')
+
+            status, stdout, stderr = self.run_main(
+                [records, "--ndjson", "--field", "post.body", "--config", config]
+            )
+            self.assertEqual(status, 1)
+            self.assertEqual(
+                [json.loads(line) for line in stdout.splitlines()],
+                [{"id": 1, "post": {"body": "<p>x</p>"}}],
+            )
+            self.assertIn("KeyError", stderr)
+            self.assertIn("1 failures", stderr)
+
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "in")
+            os.makedirs(source)
+            for i in range(5):
+                with open(os.path.join(source, f"{i}.html"), "w") as f:
+                    f.write(f"<p>{i} <b>x</b></p>")
+            with open(os.path.join(source, "empty.html"), "w") as f:
+                pass
+
+            output = os.path.join(tmp, "out")
+            argv = [
+                source,
+                "--output-dir",
+                output,
+                "--manifest",
+                os.path.join(tmp, "manifest.sqlite"),
+                "--batch-size",
+                "2",
+            ]
+            status, _stdout, stderr = self.run_main(argv)
+            self.assertEqual(status, 0)
+            self.assertIn("Sanitized 6 of 6 documents", stderr)
+            with open(os.path.join(output, "3.html")) as f:
+                self.assertEqual(f.read(), "<p>3 <strong>x</strong></p>")
+
+            status, _stdout, stderr = self.run_main(argv)
+            self.assertIn("Sanitized 0 of 0 documents", stderr)
+            self.assertIn("6 unchanged documents skipped", stderr)
+
+            with open(os.path.join(source, "3.html"), "w") as f:
+                f.write("<p>changed</p>")
+            os.remove(os.path.join(output, "4.html"))
+            status, _stdout, stderr = self.run_main(argv)
+            self.assertIn("Sanitized 2 of 2 documents", stderr)
+            with open(os.path.join(output, "3.html")) as f:
+                self.assertEqual(f.read(), "<p>changed</p>")
+            self.assertTrue(os.path.exists(os.path.join(output, "4.html")))
+
+            status, _stdout, _stderr = self.run_main(argv[:-4])
+            self.assertEqual(status, 0)
+            status, _stdout, _stderr = self.run_main([source, *argv[3:]])
+            self.assertEqual(status, 2)
+
+            # In place, only the sanitized files end up in the directory
+            status, _stdout, stderr = self.run_main(
+                [
+                    source,
+                    "--in-place",
+                    "--manifest",
+                    os.path.join(tmp, "in-place.sqlite"),
+                ]
+            )
+            self.assertIn("Sanitized 6 of 6 documents", stderr)
+            self.assertEqual(
+                sorted(os.listdir(source)),
+                [*(f"{i}.html" for i in range(5)), "empty.html"],
+            )
+            with open(os.path.join(source, "0.html")) as f:
+                self.assertEqual(f.read(), "<p>0 <strong>x</strong></p>")
+
+    def test_manifest_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "in")
+            os.makedirs(source)
+            with open(os.path.join(source, "a.html"), "w") as f:
+                f.write('<a href="https://example.com/">a</a>')
+
+            config = os.path.join(tmp, "config.py")
+            output = os.path.join(tmp, "out", "a.html")
+            argv = [
+                source,
+                "--output-dir",
+                os.path.join(tmp, "out"),
+                "--manifest",
+                os.path.join(tmp, "manifest.sqlite"),
+                "--config",
+                config,
+            ]
+            summaries = []
+            for href in ("#first", "#first", "#second"):
+                with open(config, "w") as f:
+                    f.write(
+                        f"def sanitize_href(href):\n    return {href!r}\n\n"
+                        'SETTINGS = {"sanitize_href": sanitize_href}\n'
+                    )
+                _status, _stdout, stderr = self.run_main(argv)
+                summaries.append(stderr)
+                with open(output) as f:
+                    self.assertEqual(f.read(), f'<a href="{href}">a</a>')
+            self.assertIn("1 unchanged documents skipped", summaries[1])
+            # Editing the body of a function in the settings invalidates the
+            # manifest
+            self.assertIn("Sanitized 1 of 1 documents", summaries[2])
+
+    def test_recorder_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            recorder = Recorder(tmp, min_duration=None, min_size=20, capacity=2)
+            sanitizer = Sanitizer({"recorder": recorder})
+            self.assertEqual(sanitizer.fingerprint, default_sanitizer.fingerprint)
+
+            self.assertEqual(sanitizer.sanitize("<p>short</p>"), "<p>short</p>")
+            self.assertEqual(recorder.paths(), [])
+            for i in range(3):
+                html = f"<p>{i} <span style='font-weight:bold'>long enough</span></p>"
+                self.assertEqual(
+                    sanitizer.sanitize(html, max_length=50),
+                    f"<p>{i} <strong>long enough</strong></p>",
+                )
+            entries = list(recorder.load())
+            self.assertEqual(len(entries), 2)
+            path, entry = entries[-1]
+            self.assertIn("2 <span", entry["html"])
+            self.assertEqual(entry["fingerprint"], sanitizer.fingerprint)
+            self.assertEqual(entry["options"], {"max_length": 50})
+            self.assertLessEqual(
+                {"normalize", "parse", "clean", "walk", "serialize"},
+                set(entry["phases"]),
+            )
+            # The tree walk is only timed per tag when replaying
+            self.assertNotIn("tags", entry)
+            report = replay(recorder.load(), sanitizer, profile=False)
+            self.assertEqual(set(report["tags"]), {"p", "span"})
+            self.assertEqual(report["counts"], {"p": 2, "span": 2})
+
+            # Lone surrogates are recorded as they were
+            surrogate = "<p>\ud800 long enough to be recorded</p>"
+            sanitizer.sanitize(surrogate)
+            self.assertEqual(list(recorder.load())[-1][1]["html"], surrogate)
+
+            status, stdout, _stderr = self.run_main(["replay", tmp, "--limit", "3"])
+            self.assertEqual(status, 0)
+            self.assertIn("Replayed 2 documents", stdout)
+            self.assertIn("Tree walk by tag:", stdout)
+            self.assertIn(path, stdout)
+            self.assertIn("Ordered by: cumulative time", stdout)
+
+            status, _stdout, _stderr = self.run_main(
+                ["replay", os.path.join(tmp, "missing")]
+            )
+            self.assertEqual(status, 1)
+
+
+class ServerTestCase(TestCase):
+    def start_server(self, profiles):
+        server = Server(profiles, jobs=2, max_pending=4)
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            loop.run_until_complete(server.start(port=0))
+            started.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        started.wait()
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.addCleanup(stop)
+        return server.server.sockets[0].getsockname()[1]
+
+    def test_warm_up(self):
+        server = Server(jobs=2)
+        self.addCleanup(server.executor.shutdown)
+        # All workers are started (and warmed up) before the first request
+        self.assertEqual(len(server.executor._processes), 2)
+        server.reload()
+        self.assertEqual(len(server.executor._processes), 2)
+
+    def test_server(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiles = os.path.join(tmp, "profiles.json")
+            with open(profiles, "w") as f:
+                json.dump(
+                    {
+                        "strict": {
+                            "tags": ["p"],
+                            "empty": [],
+                            "separate": [],
+                            "attributes": {},
+                        }
+                    },
+                    f,
+                )
+
+            port = self.start_server(profiles)
+            with Client(port=port, timeout=30) as client:
+                self.assertEqual(client.ping(), {"id": None, "pong": True})
+                self.assertEqual(
+                    client.sanitize("<p><b>x</b></p>"), "<p><strong>x</strong></p>"
+                )
+                self.assertEqual(
+                    client.sanitize("<p><b>x</b></p>", "strict"), "<p>x</p>"
+                )
+
+                # Pipelining, with more requests in flight than max_pending
+                htmls = [f"<p>{i} <i>x</i></p>" for i in range(100)]
+                self.assertEqual(
+                    client.sanitize_many(htmls, window=50),
+                    [default_sanitizer.sanitize(html) for html in htmls],
+                )
+
+                with self.assertRaisesRegex(ValueError, "Unknown profile 'email'"):
+                    client.sanitize_many(["<p>a</p>", "<p>b</p>"], "email")
+                self.assertEqual(client.sanitize("<p>a</p>", "strict"), "<p>a</p>")
+
+                with open(profiles, "w") as f:
+                    json.dump(
+                        {
+                            "email": {
+                                "tags": ["p"],
+                                "empty": [],
+                                "separate": [],
+                                "attributes": {},
+                            }
+                        },
+                        f,
+                    )
+                self.assertEqual(client.reload(), {"id": None, "reloaded": True})
+                self.assertEqual(client.sanitize("<p>a</p>", "email"), "<p>a</p>")
+                with self.assertRaisesRegex(ValueError, "Unknown profile 'strict'"):
+                    client.sanitize("<p>a</p>", "strict")
+
+                client.file.write(b"not json\n")
+                client.file.flush()
+                with self.assertRaisesRegex(ValueError, "Expecting value"):
+                    client.receive()
+
+
+@skipIf(django is None, "Django is not installed")
+class DjangoTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from django.conf import settings  # noqa: PLC0415
+        from django.db import connection, models  # noqa: PLC0415
+
+        from html_sanitizer.django import SanitizedHTMLField  # noqa: PLC0415
+
+        if not settings.configured:
+            settings.configure(
+                DATABASES={
+                    "default": {
+                        "ENGINE": "django.db.backends.sqlite3",
+                        "NAME": ":memory:",
+                    }
+                },
+                INSTALLED_APPS=["html_sanitizer"],
+            )
+            django.setup()
+
+        class Article(models.Model):
+            body = SanitizedHTMLField(null=True)
+            summary = SanitizedHTMLField(sanitizer="strict", blank=True)
+
+            class Meta:
+                app_label = "html_sanitizer"
+
+            def __str__(self):
+                return self.summary
+
+        with connection.schema_editor() as editor:
+            editor.create_model(Article)
+        cls.Article = Article
+
+    def profile(self, tags):
+        return {"tags": set(tags), "attributes": {}, "empty": set(), "separate": set()}
+
+    def setUp(self):
+        from django.test import override_settings  # noqa: PLC0415
+
+        self.Article.objects.all().delete()
+        overrides = override_settings(
+            HTML_SANITIZERS={
+                "strict": {
+                    "tags": {"p"},
+                    "attributes": {},
+                    "empty": set(),
+                    "separate": {"p"},
+                }
+            }
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_sanitized_html_field(self):
+        from html_sanitizer.django import SanitizedHTML  # noqa: PLC0415
+
+        article = self.Article(body="<p>a<script>x</script></p>")
+        self.assertEqual(article.body, "<p>a</p>")
+        self.assertIsInstance(article.body, SanitizedHTML)
+        self.assertEqual(article.body.sanitizer, "default")
+
+        article.summary = "<p><b>b</b></p>"
+        self.assertEqual(article.summary, "<p>b</p>")
+        # Values sanitized by another sanitizer are sanitized again
+        article.summary = article.body = SanitizedHTML("<p><b>c</b></p>")
+        self.assertEqual(article.body, "<p><b>c</b></p>")
+        self.assertEqual(article.summary, "<p>c</p>")
+        article.body = None
+        self.assertIsNone(article.body)
+        article.save()
+
+        self.Article.objects.bulk_create(
+            [self.Article(body="<B>d</B>", summary="<em>e</em>")]
+        )
+        article = self.Article.objects.latest("pk")
+        self.assertEqual((article.body, article.summary), ("<strong>d</strong>", "e"))
+        self.assertEqual(article.summary.sanitizer, "strict")
+
+        # Values loaded from the database are trusted
+        self.Article.objects.update(body="<B>f</B>")
+        self.assertEqual(self.Article.objects.latest("pk").body, "<B>f</B>")
+
+    def test_registry(self):
+        from django.core.exceptions import ImproperlyConfigured  # noqa: PLC0415
+        from django.test import override_settings  # noqa: PLC0415
+
+        from html_sanitizer.django import (  # noqa: PLC0415
+            SanitizerRegistry,
+            get_sanitizer,
+            registry,
+        )
+
+        strict = get_sanitizer("strict")
+        self.assertIs(get_sanitizer("strict"), strict)
+        self.assertIn("strict", registry.configured)
+        with override_settings(HTML_SANITIZERS={"strict": {"parsers": ["soup"]}}):
+            self.assertEqual(registry.configured, {})
+            self.assertIsNot(get_sanitizer("strict"), strict)
+        self.assertIsNot(get_sanitizer("strict"), strict)
+        with self.assertRaises(ImproperlyConfigured):
+            get_sanitizer("missing")
+
+        # Invalid configurations are skipped when warming the registry
+        with override_settings(
+            HTML_SANITIZERS={"strict": self.profile({"p"}), "broken": {"parsers": []}}
+        ):
+            registry.warm()
+            self.assertEqual(set(registry.configured), {"default", "strict"})
+
+        custom = SanitizerRegistry(maxsize=2)
+        custom.register("email", self.profile({"p"}))
+        email = custom.get("email")
+        self.assertIs(custom.get("email"), email)
+        custom.register("email", self.profile({"p", "a"}))
+        self.assertIsNot(custom.get("email"), email)
+        custom.unregister("email")
+        with self.assertRaises(ImproperlyConfigured):
+            custom.get("email")
+
+        # Sanitizers for equal settings are shared, the least recently used
+        # instances are evicted
+        a = custom.for_settings(self.profile({"p", "a"}))
+        self.assertIs(custom.for_settings(self.profile(["a", "p"])), a)
+        b = custom.for_settings(self.profile({"b"}))
+        self.assertIs(custom.for_settings(self.profile({"p", "a"})), a)
+        custom.for_settings(self.profile({"c"}))
+        self.assertEqual(len(custom.lru), 2)
+        self.assertIs(custom.for_settings(self.profile({"p", "a"})), a)
+        self.assertIsNot(custom.for_settings(self.profile({"b"})), b)
+
+    def resanitize(self, *args):
+        from django.core.management import call_command  # noqa: PLC0415
+
+        stdout = io.StringIO()
+        call_command(
+            "resanitize_html", "html_sanitizer.Article", "summary", *args, stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def test_resanitize_html(self):
+        self.Article.objects.bulk_create(
+            [self.Article(summary="<p>%s</p>" % i) for i in range(5)]
+        )
+        pks = list(self.Article.objects.order_by("pk").values_list("pk", flat=True))
+        self.Article.objects.filter(pk__in=pks[1:]).update(summary="<p><b>x</b></p>")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            state_file = os.path.join(tmp, "state.json")
+
+            # Dry runs leave the rows and an existing state file alone
+            with open(state_file, "w") as f:
+                json.dump({"last_pk": str(pks[2])}, f)
+            stdout = self.resanitize("--dry-run", "--state-file", state_file)
+            self.assertIn("Done: 2 rows processed, 2 would change", stdout)
+            self.assertTrue(os.path.exists(state_file))
+            self.assertEqual(self.Article.objects.filter(summary="<p>x</p>").count(), 0)
+
+            # Resume after the recorded primary key
+            stdout = self.resanitize("--state-file", state_file, "--batch-size", "1")
+            self.assertIn("Done: 2 rows processed, 2 changed", stdout)
+            self.assertFalse(os.path.exists(state_file))
+            self.assertEqual(
+                list(self.Article.objects.order_by("pk").values_list("summary")),
+                [("<p>0</p>",), *[("<p><b>x</b></p>",)] * 2, *[("<p>x</p>",)] * 2],
+            )
+
+        stdout = self.resanitize("--batch-size", "2")
+        self.assertIn("Done: 5 rows processed, 2 changed", stdout)
+        self.assertEqual(
+            self.Article.objects.exclude(summary__in=["<p>0</p>", "<p>x</p>"]).count(),
+            0,
+        )
+
+        # Another sanitizer than the field's own
+        stdout = self.resanitize("--sanitizer", "default")
+        self.assertIn("Done: 5 rows processed, 0 changed", stdout)
+        self.Article.objects.filter(pk=pks[0]).update(summary="<p><b>y</b></p>")
+        stdout = self.resanitize("--sanitizer", "default")
+        self.assertIn("Done: 5 rows processed, 1 changed", stdout)
+        self.assertEqual(
+            self.Article.objects.get(pk=pks[0]).summary, "<p><strong>y</strong></p>"
+        )
+
+    @skipUnless(
+        multiprocessing.get_start_method() == "fork",
+        "Worker processes only inherit the test settings when forked",
+    )
+    def test_resanitize_html_jobs(self):
+        self.Article.objects.bulk_create(
+            [self.Article(summary="<p>%s</p>" % i) for i in range(10)]
+        )
+        self.Article.objects.update(summary="<p><em>y</em></p>")
+
+        stdout = self.resanitize("--jobs", "2", "--batch-size", "4")
+        self.assertIn("Done: 10 rows processed, 10 changed", stdout)
+        self.assertEqual(
+            set(self.Article.objects.values_list("summary", flat=True)), {"<p>y</p>"}
+        )
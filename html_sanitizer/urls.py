@@ -0,0 +1,195 @@
+"""
+Declarative policies for URLs in attributes such as ``href`` and ``src``
+"""
+
+import fnmatch
+import re
+from urllib.parse import unquote, urlsplit
+
+from .caches import string_cache
+
+
+__all__ = ("URLPolicy",)
+
+
+# Browsers ignore leading and trailing C0 control characters and spaces as
+# well as tabs and newlines anywhere in URLs
+_strip_re = re.compile(r"^[\x00-\x20]+|[\x00-\x20]+$")
+_ignored_re = re.compile(r"[\t\n\r]")
+_scheme_re = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+_authority_re = re.compile(r"//[^/?#]*")
+# Browsers treat backslashes like slashes and skip any number of them before
+# the authority of special URLs, which always have one (``https:evil.com``)
+_special_schemes = frozenset({"ftp", "file", "http", "https", "ws", "wss"})
+_special_authority_re = re.compile(r"[/\\]*([^/\\?#]*)")
+_relative_authority_re = re.compile(r"[/\\]{2,}([^/\\?#]*)")
+
+
+def compile_host_patterns(patterns):
+    """
+    Compile host patterns such as ``example.com`` or ``*.example.com`` into
+    a single regular expression, or return ``None`` if there are none
+    """
+    if not patterns:
+        return None
+    return re.compile(
+        "|".join(
+            fnmatch.translate(normalize_host(pattern)) for pattern in sorted(patterns)
+        )
+    )
+
+
+def normalize_host(host):
+    """
+    Return the host as browsers resolve it: Percent-decoded, lowercased,
+    IDNA-encoded and without a trailing dot
+    """
+    host = unquote(host).lower().rstrip(".")
+    if not host.isascii():
+        host = host.encode("idna").decode("ascii")
+    return host
+
+
+def normalize_options(*, schemes, allow_hosts, deny_hosts, relative, replacement):
+    return {
+        "schemes": frozenset(scheme.lower() for scheme in schemes),
+        "allow_hosts": None if allow_hosts is None else frozenset(allow_hosts),
+        "deny_hosts": frozenset(deny_hosts),
+        "relative": relative,
+        "replacement": replacement,
+    }
+
+
+class URLPolicy:
+    """
+    Policy deciding which URLs are allowed in ``href`` and other attributes
+
+    - ``schemes``: Allowed URL schemes.
+    - ``allow_hosts``: Host patterns such as ``example.com`` or
+      ``*.example.com`` (which also matches deeper subdomains). ``None``
+      allows all hosts.
+    - ``deny_hosts``: Host patterns which are never allowed, even if they
+      match ``allow_hosts``.
+    - ``relative``: Whether URLs without a scheme (``/path``, ``page.html``,
+      ``#fragment``, ``?query``) are allowed. Protocol-relative URLs
+      (``//example.com/``) are subject to the host rules.
+    - ``replacement``: The value replacing disallowed URLs. ``None`` removes
+      the attribute instead.
+    - ``attributes``: Rules for attributes other than ``href``, e.g.
+      ``{"src": {"schemes": {"https"}, "relative": False}}``. Options which
+      aren't given are inherited.
+    - ``cache_size``: Number of URLs per attribute whose result is memoized.
+      Long URLs such as ``data:`` URLs are never cached.
+
+    Host rules only apply to URLs with a host, e.g. not to ``mailto:``
+    URLs. Hosts are matched the way browsers resolve them, e.g. without
+    percent-encoding or a trailing dot. Instances can be used as the
+    ``sanitize_href`` setting of a sanitizer, which then also checks the
+    other configured attributes.
+    """
+
+    def __init__(
+        self,
+        *,
+        schemes=("http", "https", "mailto", "tel"),
+        allow_hosts=None,
+        deny_hosts=(),
+        relative=True,
+        replacement="#",
+        attributes=None,
+        cache_size=1024,
+    ):
+        self.options = normalize_options(
+            schemes=schemes,
+            allow_hosts=allow_hosts,
+            deny_hosts=deny_hosts,
+            relative=relative,
+            replacement=replacement,
+        )
+        self.attributes = {
+            attribute: normalize_options(**{**self.options, **overrides})
+            for attribute, overrides in (attributes or {}).items()
+        }
+        self.attributes.setdefault("href", self.options)
+        self.cache_size = cache_size
+        self._compiled = None
+
+    def __repr__(self):
+        def canonical(value):
+            if isinstance(value, frozenset):
+                return repr(sorted(value))
+            return repr(value)
+
+        return "URLPolicy(%s)" % ", ".join(
+            "{}={{{}}}".format(
+                attribute,
+                ", ".join(
+                    f"{key}={canonical(value)}"
+                    for key, value in sorted(options.items())
+                ),
+            )
+            for attribute, options in sorted(self.attributes.items())
+        )
+
+    def compile(self):
+        """
+        Return a dictionary mapping attribute names to callables which
+        return the sanitized value of an URL (or ``None``)
+        """
+        if self._compiled is None:
+            self._compiled = {
+                attribute: self._compile_rules(**options)
+                for attribute, options in self.attributes.items()
+            }
+        return self._compiled
+
+    def _compile_rules(
+        self, *, schemes, allow_hosts, deny_hosts, relative, replacement
+    ):
+        allow_re = compile_host_patterns(allow_hosts)
+        deny_re = compile_host_patterns(deny_hosts)
+
+        def is_allowed(url):
+            url = _ignored_re.sub("", _strip_re.sub("", url))
+            scheme = None
+            if match := _scheme_re.match(url):
+                scheme = match.group(1).lower()
+                if scheme not in schemes:
+                    return False
+                url = url[match.end() :]
+            elif not relative:
+                return False
+
+            # Only the authority is passed to urlsplit() because it caches
+            # its results, which would keep long URLs alive. Relative URLs
+            # are resolved against special (http or https) base URLs.
+            if scheme in _special_schemes:
+                authority = _special_authority_re.match(url).group(1)
+            elif scheme is None:
+                match = _relative_authority_re.match(url)
+                authority = match and match.group(1)
+            else:
+                match = _authority_re.match(url)
+                authority = match and match.group()[2:]
+            if not authority:
+                return True
+            parts = urlsplit(f"//{authority}")
+            if not parts.netloc or (deny_re is None and allow_hosts is None):
+                return True
+            host = normalize_host(parts.hostname or "")
+            if deny_re is not None and deny_re.match(host):
+                return False
+            return allow_hosts is None or bool(allow_re and allow_re.match(host))
+
+        @string_cache(self.cache_size)
+        def sanitize(url):
+            try:
+                allowed = is_allowed(url)
+            except ValueError:  # For example invalid IPv6 addresses or IDNs
+                allowed = False
+            return url if allowed else replacement
+
+        return sanitize
+
+    def __call__(self, url, attribute="href"):
+        return self.compile()[attribute](url)